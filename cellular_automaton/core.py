@@ -1,122 +1,92 @@
 import numpy as np
 import threading
+import json
+import os
+import queue
+import re
+import struct
+import zipfile
+import multiprocessing
+from multiprocessing import shared_memory
 from copy import deepcopy
 from abc import ABC, abstractmethod
 from PIL import Image
 
+from cellular_automaton.labeling import GrainLabeling, GrainPalette
+from cellular_automaton.statistics import GrainStatistics
+
 
 class Neighborhood(ABC):
-    @abstractmethod
+    _offsets = ()
+
     def get_neighbors(self, index_0, index_1):
-        pass
+        return tuple(
+            (index_0 + offset_0, index_1 + offset_1)
+            for offset_0, offset_1 in self._offsets)
 
+    def get_offsets(self, cell_num=1):
+        return np.array(self._offsets, dtype=np.intp).reshape(1, -1, 2)
+
+    def get_all_offsets(self):
+        return self.get_offsets()
+
+
+class RandomNeighborhood(Neighborhood):
+    _alternative_offsets = ()
 
-class MooreNeighborhood(Neighborhood):
     def get_neighbors(self, index_0, index_1):
-        return ((index_0 - 1, index_1 - 1),
-                (index_0 - 1, index_1),
-                (index_0 - 1, index_1 + 1),
-                (index_0, index_1 - 1),
-                (index_0, index_1 + 1),
-                (index_0 + 1, index_1 - 1),
-                (index_0 + 1, index_1),
-                (index_0 + 1, index_1 + 1))
+        offsets = self._offsets if np.random.randint(2) else self._alternative_offsets
+        return tuple(
+            (index_0 + offset_0, index_1 + offset_1)
+            for offset_0, offset_1 in offsets)
+
+    def get_offsets(self, cell_num=1):
+        mask = np.random.randint(2, size=(cell_num, 1, 1)).astype(bool)
+        return np.where(
+            mask,
+            np.array(self._offsets, dtype=np.intp),
+            np.array(self._alternative_offsets, dtype=np.intp))
+
+    def get_all_offsets(self):
+        offsets = sorted(set(self._offsets) | set(self._alternative_offsets))
+        return np.array(offsets, dtype=np.intp).reshape(1, -1, 2)
+
+
+class MooreNeighborhood(Neighborhood):
+    _offsets = (
+        (-1, -1), (-1, 0), (-1, 1),
+        (0, -1), (0, 1),
+        (1, -1), (1, 0), (1, 1))
 
 
 class NeumannNeighborhood(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        return (
-            (index_0-1, index_1),
-            (index_0, index_1 - 1),
-            (index_0, index_1 + 1),
-            (index_0 + 1, index_1)
-        )
+    _offsets = ((-1, 0), (0, -1), (0, 1), (1, 0))
 
 
 class HexagonalLeftNeighborhood(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        return (
-            (index_0 - 1, index_1),
-            (index_0 - 1, index_1 + 1),
-            (index_0, index_1 - 1),
-            (index_0, index_1 + 1),
-            (index_0 + 1, index_1 - 1),
-            (index_0 + 1, index_1)
-        )
+    _offsets = ((-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0))
 
 
 class HexagonalRightNeighborhood(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        return (
-            (index_0 - 1, index_1 - 1),
-            (index_0 - 1, index_1),
-            (index_0, index_1 - 1),
-            (index_0, index_1 + 1),
-            (index_0 + 1, index_1),
-            (index_0 + 1, index_1 + 1)
-        )
+    _offsets = ((-1, -1), (-1, 0), (0, -1), (0, 1), (1, 0), (1, 1))
 
 
-class HexagonalRandom(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        if np.random.randint(2):
-            return (
-                (index_0 - 1, index_1),
-                (index_0 - 1, index_1 + 1),
-                (index_0, index_1 - 1),
-                (index_0, index_1 + 1),
-                (index_0 + 1, index_1 - 1),
-                (index_0 + 1, index_1)
-            )
-        return (
-            (index_0 - 1, index_1 - 1),
-            (index_0 - 1, index_1),
-            (index_0, index_1 - 1),
-            (index_0, index_1 + 1),
-            (index_0 + 1, index_1),
-            (index_0 + 1, index_1 + 1)
-        )
+class HexagonalRandom(RandomNeighborhood):
+    _offsets = HexagonalLeftNeighborhood._offsets
+    _alternative_offsets = HexagonalRightNeighborhood._offsets
 
 
 class PentagonalLeft(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        return (
-            (index_0 - 1, index_1 - 1),
-            (index_0 - 1, index_1),
-            (index_0, index_1 - 1),
-            (index_0 + 1, index_1 - 1),
-            (index_0 + 1, index_1)
-        )
+    _offsets = ((-1, -1), (-1, 0), (0, -1), (1, -1), (1, 0))
 
 
 class PentagonalRight(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        return (
-            (index_0 - 1, index_1),
-            (index_0 - 1, index_1 + 1),
-            (index_0, index_1 + 1),
-            (index_0 + 1, index_1),
-            (index_0 + 1, index_1 + 1)
-        )
+    _offsets = ((-1, 0), (-1, 1), (0, 1), (1, 0), (1, 1))
 
 
-class PentagonalRandom(Neighborhood):
-    def get_neighbors(self, index_0, index_1):
-        if np.random.randint(2):
-            return (
-                (index_0 - 1, index_1 - 1),
-                (index_0 - 1, index_1),
-                (index_0, index_1 - 1),
-                (index_0 + 1, index_1 - 1),
-                (index_0 + 1, index_1)
-            )
-        return (
-            (index_0 - 1, index_1),
-            (index_0 - 1, index_1 + 1),
-            (index_0, index_1 + 1),
-            (index_0 + 1, index_1),
-            (index_0 + 1, index_1 + 1)
-        )
+class PentagonalRandom(RandomNeighborhood):
+    _offsets = PentagonalLeft._offsets
+    _alternative_offsets = PentagonalRight._offsets
 
 
 class StateSolver(ABC):
@@ -128,12 +98,33 @@ class StateSolver(ABC):
     def ignore_ids(self, ids):
         pass
 
+    def get_ignored_ids(self):
+        return set(self._ignored_ids)
+
+    def get_next_states(self, neighbors):
+        return np.fromiter(
+            (self.get_next_state(0, row) for row in neighbors),
+            np.uint32,
+            len(neighbors))
+
+    def decide_states(self, neighbors):
+        return (
+            np.zeros(len(neighbors), dtype=np.uint32),
+            np.ones(len(neighbors), dtype=bool))
+
+    def _get_planes(self, neighbors):
+        return np.ascontiguousarray(np.asarray(neighbors, dtype=np.uint32).T)
+
+    def can_change(self, neighbors):
+        return len(neighbors) > 0
+
 
 class GrainCurvatureStateSolver(StateSolver):
     def __init__(self, probability=0.5, inclusion_id = np.uint32(-1)):
         self._probability = probability
         self._empty_id = 0
         self._ignored_ids = {inclusion_id, self._empty_id}
+        self._ignored_array = np.array(sorted(self._ignored_ids), dtype=np.uint32)
         self._cross_set = {1, 3, 4, 6}
         self._diagonal_set = {0, 2, 5, 7}
 
@@ -171,6 +162,7 @@ class GrainCurvatureStateSolver(StateSolver):
 
     def ignore_ids(self, ids):
         self._ignored_ids |= set(ids)
+        self._ignored_array = np.array(sorted(self._ignored_ids), dtype=np.uint32)
 
     def get_next_state(self, actual_state, neighbors):
         if actual_state != self._empty_id:
@@ -199,14 +191,81 @@ class GrainCurvatureStateSolver(StateSolver):
             return chosen_grain
         return self._empty_id
 
+    def _get_counts(self, planes):
+        valid = ~np.isin(planes, self._ignored_array)
+        counts = valid.astype(np.uint8)
+        cross_counts = np.zeros(planes.shape, dtype=np.uint8)
+        diagonal_counts = np.zeros(planes.shape, dtype=np.uint8)
+        for i in self._cross_set:
+            cross_counts[i] = valid[i]
+        for i in self._diagonal_set:
+            diagonal_counts[i] = valid[i]
+        first = valid.copy()
+        for i in range(len(planes)):
+            for j in range(i + 1, len(planes)):
+                equal = planes[i] == planes[j]
+                counts[i] += equal
+                counts[j] += equal
+                if j in self._cross_set:
+                    cross_counts[i] += equal
+                else:
+                    diagonal_counts[i] += equal
+                if i in self._cross_set:
+                    cross_counts[j] += equal
+                else:
+                    diagonal_counts[j] += equal
+                first[j] &= ~equal
+        return first, counts * valid, cross_counts * valid, diagonal_counts * valid
+
+    def _decide(self, planes):
+        first, counts, cross_counts, diagonal_counts = self._get_counts(planes)
+        new_states = np.zeros(planes.shape[1], dtype=np.uint32)
+        decided = ~first.any(axis=0)
+        for rule in (counts >= 5, cross_counts >= 3, diagonal_counts >= 3):
+            rule &= first
+            matched = rule.any(axis=0) & ~decided
+            positions = np.argmax(rule[:, matched], axis=0)
+            new_states[matched] = planes[positions, np.flatnonzero(matched)]
+            decided |= matched
+        return new_states, ~decided, first, counts
+
+    def decide_states(self, neighbors):
+        new_states, undecided, _, _ = self._decide(self._get_planes(neighbors))
+        return new_states, undecided
+
+    def can_change(self, neighbors):
+        if self._probability <= 0:
+            return False
+        return bool((~np.isin(neighbors, self._ignored_array)).any())
+
+    def get_next_states(self, neighbors):
+        planes = self._get_planes(neighbors)
+        new_states, undecided, first, counts = self._decide(planes)
+        undecided = np.flatnonzero(undecided)
+        if not len(undecided):
+            return new_states
+        accepted = undecided[np.random.random_sample(len(undecided)) < self._probability]
+        if not len(accepted):
+            return new_states
+        counts = counts[:, accepted]
+        candidates = first[:, accepted] & (counts == counts.max(axis=0))
+        chosen = np.random.randint(0, candidates.sum(axis=0))
+        positions = np.argmax(
+            candidates & (np.cumsum(candidates, axis=0) == chosen + 1),
+            axis=0)
+        new_states[accepted] = planes[positions, accepted]
+        return new_states
+
 
 class SimpleStateSolver(StateSolver):
     def __init__(self, inclusion_id=np.uint32(-1)):
         self._empty_id = 0
         self._ignored_ids = {inclusion_id, self._empty_id}
+        self._ignored_array = np.array(sorted(self._ignored_ids), dtype=np.uint32)
 
     def ignore_ids(self, ids):
         self._ignored_ids |= set(ids)
+        self._ignored_array = np.array(sorted(self._ignored_ids), dtype=np.uint32)
 
     def get_next_state(self, actual_state, neighbors):
         if actual_state:
@@ -225,6 +284,7 @@ class SimpleStateSolver(StateSolver):
         max_quantity = 0
         for neighbor, quant in quantity.items():
             if quant > max_quantity:
+                max_quantity = quant
                 max_neigh = [neighbor]
             elif quant == max_quantity:
                 max_neigh.append(neighbor)
@@ -233,12 +293,65 @@ class SimpleStateSolver(StateSolver):
         else:
             return max_neigh[0]
 
+    def _get_candidates(self, planes):
+        valid = ~np.isin(planes, self._ignored_array)
+        counts = valid.astype(np.uint8)
+        first = valid.copy()
+        for i in range(len(planes)):
+            for j in range(i + 1, len(planes)):
+                equal = planes[i] == planes[j]
+                counts[i] += equal
+                counts[j] += equal
+                first[j] &= ~equal
+        counts *= valid
+        return first & (counts == counts.max(axis=0, initial=0)) & (counts > 0)
+
+    def _select_candidates(self, planes, candidates, chosen):
+        positions = np.argmax(
+            candidates & (np.cumsum(candidates, axis=0) == chosen + 1),
+            axis=0)
+        new_states = planes[positions, np.arange(planes.shape[1])]
+        new_states[~candidates.any(axis=0)] = self._empty_id
+        return new_states
+
+    def get_next_states(self, neighbors):
+        planes = self._get_planes(neighbors)
+        candidates = self._get_candidates(planes)
+        candidate_num = candidates.sum(axis=0)
+        chosen = np.zeros(planes.shape[1], dtype=np.int64)
+        tied = candidate_num > 1
+        if tied.any():
+            chosen[tied] = np.random.randint(0, candidate_num[tied])
+        return self._select_candidates(planes, candidates, chosen)
+
+    def decide_states(self, neighbors):
+        planes = self._get_planes(neighbors)
+        candidates = self._get_candidates(planes)
+        chosen = np.zeros(planes.shape[1], dtype=np.int64)
+        new_states = self._select_candidates(planes, candidates, chosen)
+        return new_states, candidates.sum(axis=0) > 1
+
+    def can_change(self, neighbors):
+        return bool((~np.isin(neighbors, self._ignored_array)).any())
+
 
 class Boundary(ABC):
     @abstractmethod
     def get_value(self):
         pass
 
+    @abstractmethod
+    def pad(self, array, width=1):
+        pass
+
+    @abstractmethod
+    def update_halo(self, padded, width=1):
+        pass
+
+    @abstractmethod
+    def get_indices(self, rows, columns, height, width):
+        pass
+
 
 class PeriodicBoundary(Boundary):
     def get_value(self, index, array, height, width):
@@ -250,6 +363,18 @@ class PeriodicBoundary(Boundary):
             index_1 = (index_1 + width) % width
         return array[(index_0, index_1)]
 
+    def pad(self, array, width=1):
+        return np.pad(array, width, mode='wrap')
+
+    def update_halo(self, padded, width=1):
+        padded[:width, :] = padded[-2 * width:-width, :]
+        padded[-width:, :] = padded[width:2 * width, :]
+        padded[:, :width] = padded[:, -2 * width:-width]
+        padded[:, -width:] = padded[:, width:2 * width]
+
+    def get_indices(self, rows, columns, height, width):
+        return rows % height, columns % width
+
 
 class AbsorbBoundary(Boundary):
     def get_value(self, index, array, height, width):
@@ -261,6 +386,47 @@ class AbsorbBoundary(Boundary):
             return 0
         return array[(index_0, index_1)]
 
+    def pad(self, array, width=1):
+        return np.pad(array, width, mode='constant')
+
+    def update_halo(self, padded, width=1):
+        pass
+
+    def get_indices(self, rows, columns, height, width):
+        inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+        return rows[inside], columns[inside]
+
+
+class ReflectBoundary(Boundary):
+    def get_value(self, index, array, height, width):
+        index_0 = index[0]
+        index_1 = index[1]
+        if index_0 < 0:
+            index_0 = -index_0 - 1
+        elif index_0 >= height:
+            index_0 = 2 * height - index_0 - 1
+        if index_1 < 0:
+            index_1 = -index_1 - 1
+        elif index_1 >= width:
+            index_1 = 2 * width - index_1 - 1
+        return array[(index_0, index_1)]
+
+    def pad(self, array, width=1):
+        return np.pad(array, width, mode='symmetric')
+
+    def update_halo(self, padded, width=1):
+        padded[:width, :] = padded[width:2 * width, :][::-1, :]
+        padded[-width:, :] = padded[-2 * width:-width, :][::-1, :]
+        padded[:, :width] = padded[:, width:2 * width][:, ::-1]
+        padded[:, -width:] = padded[:, -2 * width:-width][:, ::-1]
+
+    def get_indices(self, rows, columns, height, width):
+        rows = np.where(rows < 0, -rows - 1, rows)
+        rows = np.where(rows >= height, 2 * height - rows - 1, rows)
+        columns = np.where(columns < 0, -columns - 1, columns)
+        columns = np.where(columns >= width, 2 * width - columns - 1, columns)
+        return rows, columns
+
 
 class Solver:
     def __init__(self, neighborhood, boundary, state_solver):
@@ -268,6 +434,7 @@ class Solver:
         self._state_solver = state_solver
         self._boundary = boundary
         self._moore = MooreNeighborhood()
+        self._step_info = None
 
     def _get_neighbor_values(self, array, index):
         height = len(array)
@@ -280,54 +447,64 @@ class Solver:
             (self._boundary.get_value(x, array, height, width)
              for x in self._neighborhood.get_neighbors(index[0], index[1])))
 
-    def _get_full_neighbor_values(self, array, index):
-        height = len(array)
-        width = len(array[0])
-        index_value = array[index]
-        return (
-            index_value,
-            (self._boundary.get_value(x, array, height, width)
-             for x in self._moore.get_neighbors(index[0], index[1])))
-
-
     def get_bound_array(self, array):
-        height = array.shape[0]
-        width = array.shape[1]
-        elements = (
-            (x, y) for x in range(height) for y in range(width)
-        )
-        elements_and_neighbors = (
-            self._get_full_neighbor_values(array, x)
-            for x in elements
-        )
-        boundaries = []
-        for elem, neighbors in elements_and_neighbors:
-            set_neighbors = set(neighbors)
-            if set_neighbors - {elem}:
-                boundaries.append(1)
-            else:
-                boundaries.append(0)
-        bound_array = np.array(boundaries, dtype=np.uint32)
-        bound_array.resize(array.shape)
-        return bound_array
+        array = np.asarray(array)
+        height, width = array.shape
+        padded = self._boundary.pad(array)
+        bound_array = np.zeros(array.shape, dtype=bool)
+        for offset_0, offset_1 in self._moore.get_offsets()[0]:
+            bound_array |= padded[
+                1 + offset_0:1 + offset_0 + height,
+                1 + offset_1:1 + offset_1 + width] != array
+        return bound_array.astype(np.uint32)
 
     def get_boundary_length(self, array):
-        bound_array = self.get_bound_array(array)
-        height = bound_array.shape[0]
-        width = bound_array.shape[1]
-        elements = (
-            bound_array[(x, y)] for x in range(height) for y in range(width)
-        )
-        bound_length = 0
-        for elem in elements:
-            if elem:
-                bound_length += 1
-        return bound_length // 2
+        return int(np.count_nonzero(self.get_bound_array(array))) // 2
 
     def add_ignored_ids(self, ids):
         self._state_solver.ignore_ids(ids)
 
-    def next_step(self, array):
+    def get_ignored_ids(self):
+        return self._state_solver.get_ignored_ids()
+
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _is_stable(self, padded, rows, columns):
+        if not len(rows):
+            return True
+        neighbors = VectorizedSolver._read_neighbors(
+            padded,
+            rows,
+            columns,
+            self._neighborhood.get_all_offsets())
+        return not self._state_solver.can_change(neighbors)
+
+    def _set_step_info(self, changed, empty, stable):
+        self._step_info = {
+            "changed_cells": int(changed),
+            "empty_cells": int(empty),
+            "stable": bool(stable)
+        }
+
+    def get_step_info(self):
+        return self._step_info
+
+    def get_changed_cells(self):
+        return None
+
+    def get_boundary(self):
+        return self._boundary
+
+    def _get_dtype(self, array):
+        if np.asarray(array).dtype == np.uint16:
+            return np.uint16
+        return np.uint32
+
+    def next_step(self, array, out=None):
         height = len(array)
         width = len(array[0])
         elements = (
@@ -338,11 +515,313 @@ class Solver:
         new_elements = (
             self._state_solver.get_next_state(elem, neighborhood)
             for elem, neighborhood in element_and_neighbors)
-        return np.fromiter(new_elements, np.uint32).reshape(height, width)
+        new_array = np.fromiter(new_elements, self._get_dtype(array)).reshape(height, width)
+        changed = np.count_nonzero(new_array != array)
+        rows, columns = np.nonzero(new_array == 0)
+        stable = not changed and self._is_stable(self._boundary.pad(new_array), rows, columns)
+        self._set_step_info(changed, len(rows), stable)
+        if out is not None:
+            out[...] = new_array
+            return out
+        return new_array
+
+    def advance(self, array, steps, every=None, callback=None, record=None):
+        generation = 0
+        while generation < steps:
+            array = self.next_step(array)
+            generation += 1
+            if record is not None:
+                frame = array.view()
+                frame.setflags(write=False)
+                record(frame)
+            if callback is not None and every and generation % every == 0:
+                callback(generation, array.copy())
+            if self._step_info["stable"]:
+                break
+        return array, generation
+
+
+class VectorizedSolver(Solver):
+    def __init__(self, neighborhood, boundary, state_solver, track_boundary=False):
+        super().__init__(neighborhood, boundary, state_solver)
+        self._moore_offsets = self._moore.get_offsets()[0]
+        self._track_boundary = track_boundary
+        self.invalidate()
+
+    def invalidate(self):
+        self._array = None
+        self._previous_array = None
+        self._padded = None
+        self._frontier = None
+        self._bound = None
+        self._bound_length = 0
+        self._bound_undo = None
+
+    @staticmethod
+    def _read_neighbors(padded, rows, columns, offsets):
+        neighbor_rows = rows[:, None] + 1 + offsets[:, :, 0]
+        neighbor_columns = columns[:, None] + 1 + offsets[:, :, 1]
+        return padded[neighbor_rows, neighbor_columns]
+
+    def _solve(self, rows, columns):
+        offsets = self._neighborhood.get_offsets(len(rows))
+        neighbors = self._read_neighbors(self._padded, rows, columns, offsets)
+        return self._state_solver.get_next_states(neighbors)
+
+    def _moore_indices(self, rows, columns, shape):
+        height, width = shape
+        neighbor_rows, neighbor_columns = self._boundary.get_indices(
+            (rows[:, None] + self._moore_offsets[:, 0]).ravel(),
+            (columns[:, None] + self._moore_offsets[:, 1]).ravel(),
+            height,
+            width)
+        return neighbor_rows * width + neighbor_columns
+
+    def _reset_frontier(self, array):
+        height, width = array.shape
+        self._padded = self._boundary.pad(array)
+        filled = self._padded != 0
+        near_filled = np.zeros(array.shape, dtype=bool)
+        for offset_0, offset_1 in self._moore_offsets:
+            near_filled |= filled[
+                1 + offset_0:1 + offset_0 + height,
+                1 + offset_1:1 + offset_1 + width]
+        self._frontier = np.flatnonzero(near_filled & (array == 0))
+        self._empty_num = int(np.count_nonzero(array == 0))
+        if self._track_boundary:
+            self._bound = super().get_bound_array(array).astype(bool)
+            self._bound_length = int(np.count_nonzero(self._bound))
+        self._previous_array = None
+        self._bound_undo = None
+        self._changed = None
+
+    def _update_bound(self, rows, columns, shape):
+        width = shape[1]
+        affected = np.union1d(
+            rows * width + columns,
+            self._moore_indices(rows, columns, shape))
+        affected_rows, affected_columns = np.divmod(affected, width)
+        values = self._padded[affected_rows + 1, affected_columns + 1]
+        neighbors = self._read_neighbors(
+            self._padded,
+            affected_rows,
+            affected_columns,
+            self._moore_offsets[None, :, :])
+        old_bound = self._bound.flat[affected]
+        self._bound_undo = (affected, old_bound, self._bound_length)
+        self._bound.flat[affected] = (neighbors != values[:, None]).any(axis=1)
+        self._bound_length += int(np.count_nonzero(self._bound.flat[affected])) \
+            - int(np.count_nonzero(old_bound))
+
+    def _get_tracked_bound(self, array):
+        if not self._track_boundary or self._bound is None:
+            return None
+        if array is self._array:
+            return self._bound, self._bound_length
+        if array is self._previous_array and self._bound_undo is not None:
+            affected, old_bound, bound_length = self._bound_undo
+            return (affected, old_bound), bound_length
+        return None
+
+    def get_bound_array(self, array):
+        tracked = self._get_tracked_bound(array)
+        if tracked is None:
+            return super().get_bound_array(array)
+        bound, _ = tracked
+        if isinstance(bound, tuple):
+            affected, old_bound = bound
+            bound = self._bound.copy()
+            bound.flat[affected] = old_bound
+        return bound.astype(np.uint32)
+
+    def get_boundary_length(self, array):
+        tracked = self._get_tracked_bound(array)
+        if tracked is None:
+            return super().get_boundary_length(array)
+        return tracked[1] // 2
+
+    def _update_frontier(self, array, rows, columns, new_states, unchanged):
+        self._padded[rows + 1, columns + 1] = new_states
+        self._boundary.update_halo(self._padded)
+        neighbors = self._moore_indices(rows, columns, array.shape)
+        neighbors = neighbors[array.flat[neighbors] == 0]
+        self._frontier = np.union1d(unchanged, neighbors)
+
+    def get_frontier(self):
+        return self._frontier
+
+    def get_changed_cells(self):
+        return self._changed
+
+    def _step(self, array):
+        width = array.shape[1]
+        frontier_rows, frontier_columns = np.divmod(self._frontier, width)
+        rows = frontier_rows
+        columns = frontier_columns
+        if len(rows):
+            new_states = self._solve(rows, columns)
+            changed = new_states != 0
+            rows = rows[changed]
+            columns = columns[changed]
+            array[rows, columns] = new_states[changed]
+            self._update_frontier(
+                array,
+                rows,
+                columns,
+                new_states[changed],
+                self._frontier[~changed])
+        self._empty_num -= len(rows)
+        self._changed = rows * width + columns
+        stable = not len(rows) and self._is_stable(self._padded, frontier_rows, frontier_columns)
+        self._set_step_info(len(rows), self._empty_num, stable)
+        if self._track_boundary:
+            self._update_bound(rows, columns, array.shape)
+
+    def _copy_into(self, array, out):
+        if out is None:
+            return array.copy()
+        if out is self._previous_array and self._changed is not None:
+            out.flat[self._changed] = array.flat[self._changed]
+        elif out is not array:
+            out[...] = array
+        return out
+
+    def next_step(self, array, out=None):
+        array = np.asarray(array, dtype=self._get_dtype(array))
+        if array is not self._array or self._frontier is None:
+            self._reset_frontier(array)
+        new_array = self._copy_into(array, out)
+        self._step(new_array)
+        self._previous_array = array if new_array is not array else None
+        self._array = new_array
+        return new_array
+
+    def advance(self, array, steps, every=None, callback=None, record=None):
+        array = np.asarray(array, dtype=self._get_dtype(array))
+        if array is not self._array or self._frontier is None:
+            self._reset_frontier(array)
+        new_array = array.copy()
+        frame = new_array.view()
+        frame.setflags(write=False)
+        generation = 0
+        changed = []
+        while generation < steps:
+            self._step(new_array)
+            changed.append(self._changed)
+            generation += 1
+            if record is not None:
+                record(frame)
+            if callback is not None and every and generation % every == 0:
+                callback(generation, new_array.copy())
+            if self._step_info["stable"]:
+                break
+        if changed:
+            self._changed = np.concatenate(changed)
+        self._previous_array = None
+        self._array = new_array
+        return new_array, generation
+
+
+_tile_memory = {}
+_tile_state = {}
+
+
+def _init_tile_worker(state_solver):
+    _tile_state["solver"] = state_solver
+
+
+def _solve_tile(task):
+    name, shape, dtype, rows, columns, offsets = task
+    if name not in _tile_memory:
+        for memory in _tile_memory.values():
+            memory.close()
+        _tile_memory.clear()
+        _tile_memory[name] = shared_memory.SharedMemory(name=name)
+    padded = np.ndarray(shape, dtype=dtype, buffer=_tile_memory[name].buf)
+    neighbors = VectorizedSolver._read_neighbors(padded, rows, columns, offsets)
+    return _tile_state["solver"].decide_states(neighbors)
+
+
+class ParallelSolver(VectorizedSolver):
+    def __init__(self, neighborhood, boundary, state_solver, workers=None,
+                 min_parallel_cells=4096, track_boundary=False):
+        self._workers = workers or multiprocessing.cpu_count()
+        self._min_parallel_cells = min_parallel_cells
+        self._pool = None
+        self._memory = None
+        super().__init__(neighborhood, boundary, state_solver, track_boundary)
+
+    def _reset_frontier(self, array):
+        super()._reset_frontier(array)
+        padded = self._padded
+        if self._memory is None or self._memory.size < padded.nbytes:
+            self._release_memory()
+            self._memory = shared_memory.SharedMemory(create=True, size=max(padded.nbytes, 1))
+        self._padded = np.ndarray(padded.shape, dtype=padded.dtype, buffer=self._memory.buf)
+        self._padded[:] = padded
+
+    def _release_memory(self):
+        if self._memory is not None:
+            self._padded = None
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def _solve(self, rows, columns):
+        if len(rows) < self._min_parallel_cells or self._workers < 2:
+            return super()._solve(rows, columns)
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(
+                self._workers,
+                _init_tile_worker,
+                (self._state_solver,))
+        offsets = self._neighborhood.get_offsets(len(rows))
+        height = self._padded.shape[0] - 2
+        tile_edges = np.linspace(0, height, self._workers + 1).astype(np.intp)
+        bounds = np.searchsorted(rows, tile_edges)
+        tasks = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if start == stop:
+                continue
+            tile_offsets = offsets[start:stop] if len(offsets) > 1 else offsets
+            tasks.append((
+                self._memory.name,
+                self._padded.shape,
+                self._padded.dtype.str,
+                rows[start:stop],
+                columns[start:stop],
+                tile_offsets))
+        results = self._pool.map(_solve_tile, tasks)
+        new_states = np.concatenate([states for states, _ in results])
+        undecided = np.flatnonzero(np.concatenate([flags for _, flags in results]))
+        if len(undecided):
+            undecided_offsets = offsets[undecided] if len(offsets) > 1 else offsets
+            neighbors = self._read_neighbors(
+                self._padded,
+                rows[undecided],
+                columns[undecided],
+                undecided_offsets)
+            new_states[undecided] = self._state_solver.get_next_states(neighbors)
+        return new_states
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def add_ignored_ids(self, ids):
+        super().add_ignored_ids(ids)
+        self._close_pool()
+
+    def close(self):
+        self._close_pool()
+        self._release_memory()
 
 
 class SolverCreator:
-    def create(self, neighborhood, boundary, state="simple-random-standard"):
+    def create(self, neighborhood, boundary, state="simple-random-standard", engine="standard",
+               workers=None, track_boundary=False):
         if state == "simple-random-standard":
             state = SimpleStateSolver()
             if neighborhood == "Moore":
@@ -373,16 +852,30 @@ class SolverCreator:
             boundary = PeriodicBoundary()
         elif boundary == "absorb":
             boundary = AbsorbBoundary()
+        elif boundary == "reflect":
+            boundary = ReflectBoundary()
         else:
             raise TypeError("No such boundary")
 
-        return Solver(neighborhood, boundary, state)
+        if engine == "standard":
+            return Solver(neighborhood, boundary, state)
+        elif engine == "vectorized":
+            return VectorizedSolver(neighborhood, boundary, state, track_boundary)
+        elif engine == "parallel":
+            return ParallelSolver(
+                neighborhood,
+                boundary,
+                state,
+                workers,
+                track_boundary=track_boundary)
+        raise TypeError("No such engine")
 
 
 class GrainHistory:
     def __init__(self):
         self._log = list()
         self._present_log_entry = set()
+        self._closed_phases = None
 
     def log_grain(self, grain):
         self._present_log_entry.add(grain)
@@ -396,6 +889,7 @@ class GrainHistory:
         if present_log:
             self._log.append(present_log)
         self._present_log_entry = set()
+        self._closed_phases = None
 
     def get_log(self):
         present_log = self._present_log_entry
@@ -407,12 +901,15 @@ class GrainHistory:
     def remove_grains(self, grains):
         grains = set(grains)
         for i, log_entry in enumerate(self._log):
-            self._log[i] = tuple(sorted(set(log_entry) - grains))
+            if not grains.isdisjoint(log_entry):
+                self._log[i] = tuple(x for x in log_entry if x not in grains)
         self._present_log_entry -= grains
+        self._closed_phases = None
 
     def clear(self):
         self._present_log_entry = set()
         self._log = list()
+        self._closed_phases = None
 
     def set_log(self, history):
         if not history:
@@ -422,10 +919,116 @@ class GrainHistory:
             self._log = history[:-1]
         else:
             self._log = deepcopy(history)
+        self._closed_phases = None
+
+    def get_phase(self, grain):
+        if grain in self._present_log_entry:
+            return len(self._log)
+        if self._closed_phases is None:
+            self._closed_phases = {
+                x: phase
+                for phase, log_entry in enumerate(self._log)
+                for x in log_entry}
+        return self._closed_phases.get(grain)
 
     def get_flattened_closed_phases(self):
         return (x for log_entry in self._log for x in log_entry)
 
+class GrainIndex:
+    def __init__(self, inclusion_id=np.uint32(-1)):
+        self._inclusion_id = inclusion_id
+        self._empty_id = 0
+        self.invalidate()
+
+    def invalidate(self):
+        self._ids = None
+        self._counts = None
+        self._boxes = None
+        self._width = None
+
+    def is_valid(self):
+        return self._ids is not None
+
+    def _summarize(self, values, indices):
+        if not len(values):
+            return (
+                np.empty(0, dtype=np.uint32),
+                np.empty(0, dtype=np.int64),
+                np.empty((0, 4), dtype=np.int64))
+        ids, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        rows, columns = np.divmod(indices[order], self._width)
+        boxes = np.stack((
+            np.minimum.reduceat(rows, starts),
+            np.minimum.reduceat(columns, starts),
+            np.maximum.reduceat(rows, starts),
+            np.maximum.reduceat(columns, starts)), axis=1)
+        return ids, counts.astype(np.int64), boxes.astype(np.int64)
+
+    def _select(self, values, indices):
+        valid = (values != self._empty_id) & (values != self._inclusion_id)
+        return values[valid], indices[valid]
+
+    def rebuild(self, array):
+        self._width = array.shape[1]
+        values = np.asarray(array, dtype=np.uint32).ravel()
+        indices = np.flatnonzero((values != self._empty_id) & (values != self._inclusion_id))
+        self._ids, self._counts, self._boxes = self._summarize(values[indices], indices)
+
+    def update(self, array, changed):
+        if not self.is_valid() or array.shape[1] != self._width:
+            self.rebuild(array)
+            return
+        changed = np.asarray(changed, dtype=np.int64)
+        ids, counts, boxes = self._summarize(*self._select(array.ravel()[changed], changed))
+        if not len(ids):
+            return
+        new_ids = np.setdiff1d(ids, self._ids, assume_unique=True)
+        if len(new_ids):
+            all_ids = np.concatenate((self._ids, new_ids))
+            all_ids.sort()
+            slots = np.searchsorted(all_ids, self._ids)
+            all_counts = np.zeros(len(all_ids), dtype=np.int64)
+            all_counts[slots] = self._counts
+            all_boxes = np.empty((len(all_ids), 4), dtype=np.int64)
+            all_boxes[:, :2] = np.iinfo(np.int64).max
+            all_boxes[:, 2:] = -1
+            all_boxes[slots] = self._boxes
+            self._ids, self._counts, self._boxes = all_ids, all_counts, all_boxes
+        slots = np.searchsorted(self._ids, ids)
+        self._counts[slots] += counts
+        self._boxes[slots, :2] = np.minimum(self._boxes[slots, :2], boxes[:, :2])
+        self._boxes[slots, 2:] = np.maximum(self._boxes[slots, 2:], boxes[:, 2:])
+
+    def _find(self, grain):
+        slot = np.searchsorted(self._ids, grain)
+        if slot < len(self._ids) and self._ids[slot] == grain:
+            return slot
+        return None
+
+    def get_ids(self):
+        return set(self._ids.tolist())
+
+    def get_grain_number(self):
+        return len(self._ids)
+
+    def get_count(self, grain):
+        slot = self._find(grain)
+        if slot is None:
+            return 0
+        return int(self._counts[slot])
+
+    def get_counts(self):
+        return self._ids.copy(), self._counts.copy()
+
+    def get_bounding_box(self, grain):
+        slot = self._find(grain)
+        if slot is None:
+            return None
+        return tuple(int(x) for x in self._boxes[slot])
+
+
 class SeedSelector:
     def __init__(self):
         self._selected = set()
@@ -444,14 +1047,377 @@ class SeedSelector:
         self._selected = set()
 
 
+class CsvGridFile:
+    _chunk_rows = 256
+    _scalar = re.compile(r'np\.\w+\((\d+)\)')
+    _entry = re.compile(r'([(\[{])([^()\[\]{}]*)[)\]}]')
+
+    def _write_rows(self, file, array, prefix=''):
+        values, indices = np.unique(array, return_inverse=True)
+        names = np.array([str(x) for x in values.tolist()], dtype=object)
+        indices = indices.reshape(array.shape)
+        for start in range(0, len(array), self._chunk_rows):
+            rows = names[indices[start:start + self._chunk_rows]].tolist()
+            file.write(''.join([prefix + ','.join(row) + '\n' for row in rows]))
+
+    def _parse_rows(self, rows):
+        width = rows[0].count(',') + 1
+        array = np.fromstring(','.join(rows), dtype=np.uint32, sep=',')
+        return array.reshape(-1, width)
+
+    def _concatenate(self, chunks, rows):
+        if rows:
+            chunks.append(self._parse_rows(rows))
+        if not chunks:
+            return None
+        return np.concatenate(chunks)
+
+    def format_log(self, log):
+        return "{}".format(log)
+
+    def parse_log(self, text):
+        text = self._scalar.sub(r'\1', text.strip())
+        if text[:1] != '[' or text[-1:] != ']':
+            raise ValueError("Invalid grains log")
+        log = []
+        for bracket, content in self._entry.findall(text[1:-1]):
+            ids = [int(x) for x in content.replace(',', ' ').split()]
+            if bracket == '{':
+                log.append(set(ids))
+            else:
+                log.append(tuple(ids))
+        return log
+
+    def save(self, filename, array, log, mode, bound_array=None):
+        with open(filename, 'w') as file:
+            self._write_rows(file, array)
+            file.write("#grains:{}:{}\n".format(self.format_log(log), mode))
+            if bound_array is not None:
+                self._write_rows(file, bound_array, "#b ")
+
+    def load(self, filename):
+        chunks, rows = [], []
+        bound_chunks, bound_rows = [], []
+        log, mode = None, None
+        with open(filename) as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                if not line.startswith('#'):
+                    rows.append(line)
+                    if len(rows) == self._chunk_rows:
+                        chunks.append(self._parse_rows(rows))
+                        rows = []
+                elif line.startswith('#b '):
+                    bound_rows.append(line[3:])
+                    if len(bound_rows) == self._chunk_rows:
+                        bound_chunks.append(self._parse_rows(bound_rows))
+                        bound_rows = []
+                elif line.startswith('#grains') and log is None:
+                    _, log, mode = line.split(':')
+        if log is None:
+            raise ValueError("Missing grains line")
+        array = self._concatenate(chunks, rows)
+        if array is None:
+            array = np.zeros((0, 0), dtype=np.uint32)
+        bound_array = self._concatenate(bound_chunks, bound_rows)
+        return array, self.parse_log(log), mode, bound_array
+
+
+class BinaryGridFile:
+    _magic = b'CAGRID01'
+    _header = struct.Struct('<8sQQQQQQ')
+    _alignment = 64
+
+    def _align(self, offset):
+        return -(-offset // self._alignment) * self._alignment
+
+    def save(self, filename, array, log, mode, bound_array=None):
+        array = np.ascontiguousarray(array, dtype='<u4')
+        height, width = array.shape
+        grid_offset = self._align(self._header.size)
+        position = grid_offset + array.nbytes
+        bound_offset = 0
+        bound_bits = None
+        if bound_array is not None:
+            bound_bits = np.packbits(np.asarray(bound_array, dtype=bool), axis=None)
+            bound_offset = position
+            position += bound_bits.nbytes
+        present = None
+        if log and isinstance(log[-1], set):
+            present = sorted(int(x) for x in log[-1])
+            log = log[:-1]
+        meta = json.dumps({
+            "phases": [[int(x) for x in phase] for phase in log],
+            "present": present,
+            "mode": mode
+        }).encode('utf-8')
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(self._header.pack(
+                self._magic,
+                height,
+                width,
+                grid_offset,
+                bound_offset,
+                position,
+                len(meta)))
+            file.write(b'\0' * (grid_offset - self._header.size))
+            array.tofile(file)
+            if bound_bits is not None:
+                bound_bits.tofile(file)
+            file.write(meta)
+        os.replace(temporary, filename)
+
+    def load(self, filename, mmap=True):
+        with open(filename, 'rb') as file:
+            magic, height, width, grid_offset, bound_offset, meta_offset, meta_length = \
+                self._header.unpack(file.read(self._header.size))
+            if magic != self._magic:
+                raise ValueError("Not a grid file")
+            file.seek(meta_offset)
+            meta = json.loads(file.read(meta_length).decode('utf-8'))
+            bound_array = None
+            if bound_offset:
+                file.seek(bound_offset)
+                bound_bits = np.fromfile(file, dtype=np.uint8, count=-(-height * width // 8))
+                bound_array = np.unpackbits(bound_bits, count=height * width)
+                bound_array = bound_array.reshape(height, width).astype(np.uint32)
+        if mmap:
+            array = np.memmap(
+                filename, dtype='<u4', mode='c', offset=grid_offset, shape=(height, width))
+        else:
+            array = np.fromfile(
+                filename, dtype='<u4', count=height * width, offset=grid_offset)
+            array = array.reshape(height, width)
+        log = [tuple(phase) for phase in meta["phases"]]
+        if meta["present"] is not None:
+            log.append(set(meta["present"]))
+        return array, log, meta["mode"], bound_array
+
+
+class FrameExporter:
+    def __init__(self, filename, every=1, chunk_frames=16, queue_size=4, compresslevel=1):
+        self._every = every
+        self._chunk_frames = chunk_frames
+        self._chunk = None
+        self._generations = []
+        self._generation = 0
+        self._chunk_index = 0
+        self._error = None
+        self._queue = queue.Queue(queue_size)
+        self._archive = zipfile.ZipFile(
+            filename,
+            'w',
+            zipfile.ZIP_DEFLATED,
+            allowZip64=True,
+            compresslevel=compresslevel)
+        self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._thread.start()
+
+    def _write_chunks(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            index, chunk, generations = item
+            try:
+                if self._error is None:
+                    self._write_array('frames_{:06d}.npy'.format(index), chunk)
+                    self._write_array('generations_{:06d}.npy'.format(index), generations)
+            except Exception as error:
+                self._error = error
+
+    def _write_array(self, name, array):
+        with self._archive.open(name, 'w', force_zip64=True) as entry:
+            np.lib.format.write_array(entry, array, allow_pickle=False)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _flush(self):
+        if not self._generations:
+            return
+        length = len(self._generations)
+        generations = np.array(self._generations, dtype=np.uint64)
+        self._queue.put((self._chunk_index, self._chunk[:length], generations))
+        self._chunk_index += 1
+        self._chunk = None
+        self._generations = []
+
+    def add(self, array, palette=None):
+        self._check_error()
+        generation = self._generation
+        self._generation += 1
+        if generation % self._every:
+            return
+        if self._chunk is None or self._chunk.shape[1:] != array.shape:
+            self._flush()
+            self._chunk = np.empty((self._chunk_frames,) + array.shape, dtype=np.uint32)
+        if palette is None:
+            self._chunk[len(self._generations)] = array
+        else:
+            np.take(palette, array, out=self._chunk[len(self._generations)])
+        self._generations.append(generation)
+        if len(self._generations) == self._chunk_frames:
+            self._flush()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._archive.close()
+        self._check_error()
+
+    @staticmethod
+    def read_frames(filename):
+        with np.load(filename, allow_pickle=False) as archive:
+            chunks = sorted(name for name in archive.files if name.startswith('frames_'))
+            for name in chunks:
+                frames = archive[name]
+                generations = archive[name.replace('frames_', 'generations_')]
+                for generation, frame in zip(generations, frames):
+                    yield int(generation), frame
+
+
+class FrameHistory:
+    def __init__(self, keyframe_interval=64, max_frames=None):
+        if max_frames is not None and max_frames < keyframe_interval:
+            raise ValueError("max_frames must be at least keyframe_interval")
+        self._keyframe_interval = keyframe_interval
+        self._max_frames = max_frames
+        self.clear()
+
+    def clear(self):
+        self._keyframes = {}
+        self._deltas = []
+        self._last = None
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def record(self, array, changed=None):
+        generation = len(self._deltas)
+        if self._last is None or self._last.shape != array.shape or self._last.dtype != array.dtype:
+            self.clear()
+            generation = 0
+            self._last = np.array(array)
+            self._deltas.append(None)
+            self._keyframes[0] = self._last.copy()
+            return
+        if changed is None:
+            indices = np.flatnonzero(array != self._last)
+        else:
+            changed = np.asarray(changed, dtype=np.intp)
+            indices = changed[array.ravel()[changed] != self._last.ravel()[changed]]
+        values = array.ravel()[indices]
+        self._last.ravel()[indices] = values
+        self._deltas.append((indices.astype(np.uint32), values))
+        if generation % self._keyframe_interval == 0:
+            self._keyframes[generation] = self._last.copy()
+        if self._max_frames is not None and len(self._deltas) > self._max_frames:
+            excess = len(self._deltas) - self._max_frames
+            self._drop(-(-excess // self._keyframe_interval) * self._keyframe_interval)
+
+    def _drop(self, count):
+        self._keyframes = {x - count: y for x, y in self._keyframes.items() if x >= count}
+        self._deltas = [None] + self._deltas[count + 1:]
+
+    def get_frame(self, generation):
+        if generation < 0:
+            generation += len(self._deltas)
+        if not 0 <= generation < len(self._deltas):
+            raise IndexError("No such generation")
+        keyframe = generation - generation % self._keyframe_interval
+        frame = self._keyframes[keyframe].copy()
+        flat = frame.ravel()
+        for indices, values in self._deltas[keyframe + 1:generation + 1]:
+            flat[indices] = values
+        return frame
+
+    def truncate(self, length):
+        if length <= 0:
+            self.clear()
+            return
+        if length >= len(self._deltas):
+            return
+        self._last = self.get_frame(length - 1)
+        del self._deltas[length:]
+        for generation in [x for x in self._keyframes if x >= length]:
+            del self._keyframes[generation]
+
+    def save(self, filename):
+        generations = sorted(self._keyframes)
+        deltas = self._deltas[1:]
+        dtype = np.uint32 if self._last is None else self._last.dtype
+        with open(filename, 'wb') as file:
+            np.savez_compressed(
+                file,
+                keyframe_interval=np.array(self._keyframe_interval),
+                keyframe_generations=np.array(generations, dtype=np.uint64),
+                keyframes=np.array([self._keyframes[x] for x in generations]),
+                delta_lengths=np.array([len(x) for x, _ in deltas], dtype=np.uint64),
+                delta_indices=np.concatenate([x for x, _ in deltas] or [np.empty(0, np.uint32)]),
+                delta_values=np.concatenate([x for _, x in deltas] or [np.empty(0, dtype)]))
+
+    def load(self, filename):
+        self.clear()
+        with np.load(filename, allow_pickle=False) as archive:
+            self._keyframe_interval = int(archive['keyframe_interval'])
+            for generation, keyframe in zip(archive['keyframe_generations'], archive['keyframes']):
+                self._keyframes[int(generation)] = keyframe
+            bounds = np.cumsum(archive['delta_lengths'])[:-1].astype(np.intp)
+            indices = np.split(archive['delta_indices'], bounds)
+            values = np.split(archive['delta_values'], bounds)
+            self._deltas.append(None)
+            if len(archive['delta_lengths']):
+                self._deltas.extend(zip(indices, values))
+        if self._keyframes:
+            self._last = self.get_frame(-1)
+        else:
+            self._deltas = []
+
+
+class CheckpointFile:
+    def save(self, filename, array, state, rng_state):
+        name, keys, position, has_gauss, cached_gaussian = rng_state
+        meta = dict(state, rng=[name, int(position), int(has_gauss), float(cached_gaussian)])
+        meta = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez_compressed(file, array=array, rng_keys=keys, meta=meta)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+
+    def load(self, filename):
+        with np.load(filename, allow_pickle=False) as archive:
+            array = np.array(archive['array'], dtype=np.uint32)
+            keys = archive['rng_keys']
+            meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+        name, position, has_gauss, cached_gaussian = meta.pop('rng')
+        return array, meta, (name, keys, position, has_gauss, cached_gaussian)
+
+
 class MainController:
     def __init__(self):
         self._solver_creator = SolverCreator()
         self._array_builder = ArrayBuilder()
+        self._csv_file = CsvGridFile()
+        self._binary_file = BinaryGridFile()
+        self._checkpoint_file = CheckpointFile()
+        self._grain_statistics = GrainStatistics()
+        self._grain_labeling = GrainLabeling()
         self._array = None
         self._displayed_array = None
         self._array_lock = threading.Lock()
-        self._solver = self._solver_creator.create("Moore", "periodic")
+        self._solver_config = ["Moore", "periodic", "simple-random-standard", "standard", None, False]
+        self._solver = self._solver_creator.create(*self._solver_config)
         self._solver_lock = threading.Lock()
         self._loop_on = False
         self._loop_lock = threading.Lock()
@@ -464,15 +1430,137 @@ class MainController:
         self._grain_history_lock = threading.Lock()
         self._seed_selector = SeedSelector()
         self._seed_selector_lock = threading.Lock()
+        self._stable = False
+        self._buffers = None
+        self._snapshot = None
+        self._snapshot_source = None
+        self._exporter = None
+        self._history = None
+        self._grain_index = None
+        self._generation = 0
+        self._palette = None
+
+    def _get_out_buffer(self, array):
+        if self._buffers is not None and self._buffers[0].shape == array.shape:
+            if array is self._buffers[0]:
+                return self._buffers[1]
+            if array is self._buffers[1]:
+                return self._buffers[0]
+        self._buffers = (
+            np.empty(array.shape, dtype=array.dtype),
+            np.empty(array.shape, dtype=array.dtype))
+        return self._buffers[0]
 
     def _array_solver_function(self, array):
+        if self._stable:
+            return array
+        out = self._get_out_buffer(array)
         with self._solver_lock:
-            return self._solver.next_step(array)
+            array = self._solver.next_step(array, out)
+            self._stable = self._solver.get_step_info()["stable"]
+            self._update_grain_index(array)
+            changed = self._solver.get_changed_cells()
+        self._generation += 1
+        self._record(array, changed)
+        return array
+
+    def _get_snapshot(self):
+        if self._snapshot is None or self._snapshot_source is not self._displayed_array:
+            if self._palette is None:
+                self._snapshot = np.array(self._displayed_array, copy=True)
+            else:
+                self._snapshot = self._palette.decode(self._displayed_array)
+            self._snapshot.setflags(write=False)
+            self._snapshot_source = self._displayed_array
+        return self._snapshot
+
+    def _encode(self, array):
+        if self._palette is None or array is None:
+            return array
+        return self._palette.encode(array)
+
+    def _decode(self, array):
+        if self._palette is None or array is None:
+            return array
+        return self._palette.decode(array)
+
+    def _get_palette_table(self):
+        if self._palette is None:
+            return None
+        return self._palette.get_table()
+
+    def _get_labels(self, ids):
+        if self._palette is None:
+            return ids
+        return self._palette.get_labels(ids)
+
+    def _get_ids(self, labels):
+        if self._palette is None:
+            return labels
+        labels = [x for x in labels if x <= self._palette.inclusion_label]
+        return set(self._palette.decode(np.array(sorted(labels), dtype=np.intp)).tolist())
+
+    def _new_grain_index(self):
+        if self._palette is None:
+            return GrainIndex()
+        return GrainIndex(self._palette.inclusion_label)
+
+    def set_compact_storage(self, enabled=True):
+        with self._array_lock:
+            if enabled == (self._palette is not None):
+                return
+            array = self._decode(self._array)
+            palette = GrainPalette() if enabled else None
+            if palette is not None and array is not None:
+                array = palette.encode(array)
+            self._palette = palette
+            self._array = array
+            self._displayed_array = self._array
+            self._buffers = None
+            if self._grain_index is not None:
+                self._grain_index = self._new_grain_index()
+        self._rebuild_solver()
+        self._invalidate_solver()
+        self.next_vision_step()
+
+    def _rebuild_solver(self):
+        with self._grain_history_lock:
+            ignored_ids = self._grain_history.get_flattened_closed_phases()
+        self.update_solver(*self._solver_config)
+        with self._solver_lock:
+            self._solver.add_ignored_ids(self._get_labels(ignored_ids))
+
+    def is_compact_storage(self):
+        return self._palette is not None
+
+    def _update_grain_index(self, array):
+        if self._grain_index is None:
+            return
+        changed = self._solver.get_changed_cells()
+        if changed is None:
+            self._grain_index.rebuild(array)
+        else:
+            self._grain_index.update(array, changed)
+
+    def _invalidate_solver(self):
+        with self._solver_lock:
+            self._solver.invalidate()
+        self._stable = False
+        self._snapshot = None
+        with self._array_lock:
+            if self._grain_index is not None:
+                self._grain_index.invalidate()
+            if self._history is not None and self._array is not None:
+                self._history.clear()
+                self._history.record(self._array)
+
+    def _array_vision_function(self, array):
+        return array
 
     def _set_loop_mode(self, mode):
         with self._loop_mode_lock:
             if mode == 'vision':
-                self._loop_mode_function = deepcopy
+                self._loop_mode_function = self._array_vision_function
             elif mode == 'generation':
                 self._loop_mode_function = self._array_solver_function
 
@@ -482,25 +1570,203 @@ class MainController:
                 with self._array_lock:
                     self._displayed_array = self._array
                     self._array = self._loop_mode_function(self._array)
+                    snapshot = self._get_snapshot()
             self._set_loop_mode('generation')
-            yield deepcopy(self._displayed_array)
+            yield snapshot
+
+    def advance(self, steps, every=None, callback=None):
+        with self._array_lock:
+            if self._stable or steps <= 0:
+                return 0
+            record = None
+            if self._exporter is not None or self._history is not None:
+                record = self._record_step
+            with self._solver_lock:
+                self._array, generation = self._solver.advance(
+                    self._array,
+                    steps,
+                    every,
+                    callback,
+                    record)
+                self._stable = self._solver.get_step_info()["stable"]
+                self._update_grain_index(self._array)
+            self._displayed_array = self._array
+            self._generation += generation
+        return generation
+
+    def _record(self, array, changed=None):
+        if self._exporter is not None:
+            self._exporter.add(array, self._get_palette_table())
+        if self._history is not None:
+            self._history.record(array, changed)
+
+    def _record_step(self, array):
+        self._record(array, self._solver.get_changed_cells())
+
+    def start_export(self, filename, every=1, chunk_frames=16):
+        self.stop_export()
+        with self._array_lock:
+            self._exporter = FrameExporter(filename, every, chunk_frames)
+            if self._array is not None:
+                self._exporter.add(self._array, self._get_palette_table())
+
+    def stop_export(self):
+        with self._array_lock:
+            exporter, self._exporter = self._exporter, None
+        if exporter is not None:
+            exporter.close()
+
+    def start_indexing(self):
+        with self._array_lock:
+            self._grain_index = self._new_grain_index()
+
+    def stop_indexing(self):
+        with self._array_lock:
+            self._grain_index = None
+
+    def _get_grain_index(self):
+        if self._grain_index is None or self._array is None:
+            return None
+        if not self._grain_index.is_valid():
+            self._grain_index.rebuild(self._array)
+        return self._grain_index
+
+    def get_grain_info(self, grain):
+        with self._array_lock:
+            grain_index = self._get_grain_index()
+            if grain_index is None:
+                return None
+            with self._grain_history_lock:
+                phase = self._grain_history.get_phase(grain)
+            labels = self._get_labels([grain])
+            if not labels:
+                return {"cells": 0, "bounding_box": None, "phase": phase}
+            return {
+                "cells": grain_index.get_count(labels[0]),
+                "bounding_box": grain_index.get_bounding_box(labels[0]),
+                "phase": phase
+            }
+
+    def start_recording(self, keyframe_interval=64, max_frames=None):
+        with self._array_lock:
+            self._history = FrameHistory(keyframe_interval, max_frames)
+            if self._array is not None:
+                self._history.record(self._array)
+
+    def stop_recording(self):
+        with self._array_lock:
+            history, self._history = self._history, None
+        return history
+
+    def get_history(self):
+        return self._history
+
+    def rewind(self, steps=1):
+        with self._array_lock:
+            if self._history is None or not len(self._history):
+                return None
+            generation = max(len(self._history) - 1 - steps, 0)
+            self._array = self._history.get_frame(generation)
+            self._generation -= len(self._history) - 1 - generation
+            self._history.truncate(generation + 1)
+            if self._grain_index is not None:
+                self._grain_index.invalidate()
+            with self._solver_lock:
+                self._solver.invalidate()
+            self._stable = False
+            self._snapshot = None
+        self.next_vision_step()
+        return generation
+
+    def run_until_stable(self, max_steps=None, every=None, callback=None):
+        if max_steps is None:
+            max_steps = np.inf
+        return self.advance(max_steps, every, callback)
+
+    def is_stable(self):
+        with self._array_lock:
+            return self._stable
+
+    def get_generation(self):
+        with self._array_lock:
+            return self._generation
+
+    def save_checkpoint(self, filename):
+        with self._array_lock:
+            array = self._decode(self._array)
+            with self._grain_history_lock:
+                log = self._grain_history.get_log()
+            with self._seed_selector_lock:
+                selected = self._seed_selector.get_selected()
+            with self._solver_lock:
+                ignored_ids = self._get_ids(self._solver.get_ignored_ids())
+            palette = None
+            if self._palette is not None:
+                palette = self._palette.get_ids().tolist()
+            state = {
+                "solver": self._solver_config,
+                "log": self._csv_file.format_log(log),
+                "selected": sorted(int(x) for x in selected),
+                "ignored_ids": sorted(int(x) for x in ignored_ids),
+                "stable": self._stable,
+                "generation": self._generation,
+                "palette": palette
+            }
+            self._checkpoint_file.save(filename, array, state, np.random.get_state())
+
+    def load_checkpoint(self, filename):
+        array, state, rng_state = self._checkpoint_file.load(filename)
+        self.set_compact_storage(state.get("palette") is not None)
+        self.update_solver(*state["solver"])
+        with self._array_lock:
+            if self._palette is not None:
+                self._palette.set_ids(state["palette"])
+            self._array = self._encode(array)
+            self._displayed_array = self._array
+            with self._grain_history_lock:
+                self._grain_history.clear()
+                self._grain_history.set_log(self._csv_file.parse_log(state["log"]))
+            with self._seed_selector_lock:
+                self._seed_selector.clear()
+                for seed in state["selected"]:
+                    self._seed_selector.toggle_seed(seed)
+            with self._solver_lock:
+                self._solver.add_ignored_ids(self._get_labels(state["ignored_ids"]))
+        self._invalidate_solver()
+        with self._array_lock:
+            self._stable = state["stable"]
+            self._generation = state["generation"]
+        np.random.set_state(rng_state)
+        self.next_vision_step()
 
     def reset(self, height, width, seed_num, inclusion_num=0, inc_min_radius=0, inc_max_radius=0):
         self._array_builder.new_array(height, width)
         added_seeds = self._array_builder.add_seed(seed_num)
         self._array_builder.add_inclusions(inclusion_num, inc_min_radius, inc_max_radius)
         with self._array_lock:
-            self._array = self._array_builder.get_array()
+            if self._palette is not None:
+                self._palette.clear()
+            self._array = self._encode(self._array_builder.get_array())
             with self._grain_history_lock:
                 self._grain_history.clear()
                 self._grain_history.log_grains(added_seeds)
+            self._generation = 0
+        if self._palette is not None:
+            self._rebuild_solver()
+        self._invalidate_solver()
         self.next_step()
 
     def clear(self):
         with self._array_lock:
-            self._array = np.zeros(self._array.shape, dtype=np.uint32)
+            self._array = np.zeros(self._array.shape, dtype=self._array.dtype)
+            self._generation = 0
+            if self._palette is not None:
+                self._palette.clear()
         with self._grain_history_lock:
             self._grain_history.clear()
+        if self._palette is not None:
+            self._rebuild_solver()
+        self._invalidate_solver()
         self.next_step()
 
     def select_field(self, field):
@@ -514,28 +1780,40 @@ class MainController:
 
     def remove_selected_fields(self):
         with self._array_lock:
-            if self._displayed_array is not None:
-                self._array = self._displayed_array
-            self._array_builder.set_array(self._array)
             with self._seed_selector_lock:
                 selected = self._seed_selector.get_selected()
                 self._seed_selector.clear()
-            self._array_builder.remove_fields(selected)
-            self._grain_history.remove_grains(selected)
-            self._array = self._array_builder.get_array()
+            grain_index = self._get_grain_index()
+            boxes = None
+            if grain_index is not None:
+                boxes = {
+                    x: grain_index.get_bounding_box(label)
+                    for x, label in zip(selected, self._get_labels(selected))}
+            if self._displayed_array is not None:
+                self._array = self._displayed_array
+            self._array_builder.set_array(self._decode(self._array))
+            self._array_builder.remove_fields(selected, boxes)
+            with self._grain_history_lock:
+                self._grain_history.remove_grains(selected)
+            self._array = self._encode(self._array_builder.get_array())
+        self._invalidate_solver()
         self.next_step()
 
     def reseed(self, seed_num, inclusion_num=0, inc_min_radius=0, inc_max_radius=0):
         with self._array_lock:
             if self._displayed_array is not None:
                 self._array = self._displayed_array
-            self._array_builder.set_array(self._array)
-            added_seeds = self._array_builder.add_seed(seed_num)
+            self._array_builder.set_array(self._decode(self._array))
+            present_seeds = None
+            grain_index = self._get_grain_index()
+            if grain_index is not None:
+                present_seeds = self._get_ids(grain_index.get_ids())
+            added_seeds = self._array_builder.add_seed(seed_num, present_seeds)
             with self._grain_history_lock:
                 self._grain_history.log_grains(added_seeds)
             self._array_builder.add_inclusions(inclusion_num, inc_min_radius, inc_max_radius)
-            self._array = self._array_builder.get_array()
-            from pprint import PrettyPrinter
+            self._array = self._encode(self._array_builder.get_array())
+        self._invalidate_solver()
         self.next_step()
 
     def new_phase(self):
@@ -544,15 +1822,24 @@ class MainController:
             log = self._grain_history.get_log()
         with self._solver_lock:
             if log:
-                self._solver.add_ignored_ids(log[-1])
+                self._solver.add_ignored_ids(self._get_labels(log[-1]))
+        self._stable = False
         self.next_vision_step()
 
-    def update_solver(self, neighborhood, boundary, state="simple-random-standard"):
+    def update_solver(self, neighborhood, boundary, state="simple-random-standard", engine="standard",
+                      workers=None, track_boundary=False):
         with self._solver_lock:
-            self._solver = self._solver_creator.create(
-                neighborhood,
-                boundary,
-                state)
+            self._solver.close()
+            self._solver_config = [neighborhood, boundary, state, engine, workers, track_boundary]
+            self._solver = self._solver_creator.create(*self._solver_config)
+            if self._palette is not None:
+                self._solver.add_ignored_ids([self._palette.inclusion_label])
+        self._stable = False
+
+    def close(self):
+        self.stop_export()
+        with self._solver_lock:
+            self._solver.close()
 
     def open_gate(self):
         with self._loop_lock:
@@ -595,63 +1882,86 @@ class MainController:
             return self._delay
 
     def get_boundary_array(self):
-        return self._solver.get_bound_array(self._displayed_array)
+        with self._array_lock:
+            with self._solver_lock:
+                return self._solver.get_bound_array(self._displayed_array)
 
-    def save(self, filename, mode="single"):
+    def save(self, filename, mode="single", boundary=True):
         with self._array_lock:
-            array = self._displayed_array
+            if self._palette is None:
+                array = np.array(self._displayed_array, copy=True)
+            else:
+                array = self._palette.decode(self._displayed_array)
+            bound_array = None
+            if boundary and filename.endswith(('.csv', '.cag')):
+                with self._solver_lock:
+                    bound_array = self._solver.get_bound_array(self._displayed_array)
             with self._grain_history_lock:
                 log = self._grain_history.get_log()
         if filename.endswith('.csv'):
-            with open(filename, 'w') as file:
-                for row in array:
-                    file.write(','.join((str(x) for x in row)))
-                    file.write('\n')
-                file.write("#grains:{}:{}\n".format(log, mode))
-                bound_array = self.get_boundary_array()
-                for row in bound_array:
-                    file.write("#b ")
-                    file.write(','.join((str(x) for x in row)))
-                    file.write('\n')
+            self._csv_file.save(filename, array, log, mode, bound_array)
+        if filename.endswith('.cag'):
+            self._binary_file.save(filename, array, log, mode, bound_array)
         if filename.endswith('.png'):
             image = Image.fromarray(array, 'CMYK').convert('RGB')
             image.save(filename)
 
-    def load(self, filename):
-        array = []
+    def load(self, filename, mmap=True):
         if filename.endswith('.csv'):
-            lines = (
-                line.strip().split(',')
-                for line in open(filename)
-                if line.strip() and not line.startswith('#'))
-            _, log, mode = next(
-                line.strip().split(':')
-                for line in open(filename)
-                if line.strip().startswith('#grains'))
-            array.extend(lines)
+            array, log, mode, _ = self._csv_file.load(filename)
+        if filename.endswith('.cag'):
+            array, log, mode, _ = self._binary_file.load(filename, mmap)
         with self._array_lock:
-            self._array = np.array(array, dtype=np.uint32)
-            log = eval(log)
+            if self._palette is not None:
+                self._palette.clear()
+            self._array = self._encode(array)
+            self._generation = 0
             with self._grain_history_lock:
                 self._grain_history.set_log(log)
                 ignored_ids =  self._grain_history.get_flattened_closed_phases()
             with self._solver_lock:
-                self._solver.add_ignored_ids(ignored_ids)
+                self._solver.add_ignored_ids(self._get_labels(ignored_ids))
+        if self._palette is not None:
+            self._rebuild_solver()
+        self._invalidate_solver()
         self.next_step()
 
     def get_statistics(self):
         with self._array_lock:
             with self._solver_lock:
                 length = self._solver.get_boundary_length(self._displayed_array)
+            grain_index = None
+            if self._displayed_array is self._array:
+                grain_index = self._get_grain_index()
+            if grain_index is not None:
+                _, areas = grain_index.get_counts()
+            else:
+                _, areas = self._grain_statistics.get_areas(self._decode(self._displayed_array))
+            average_size = int(areas.sum()) // len(areas) if len(areas) else 0
+            return {
+                "average_size": average_size,
+                "grain_boundary_length": length
+            }
+
+    def get_grain_statistics(self, bins=10):
+        with self._array_lock:
+            array = self._decode(self._displayed_array)
+            with self._grain_history_lock:
                 log = self._grain_history.get_log()
-                all_ids = []
-                for phase in log:
-                    all_ids.extend(list(phase))
-                average_size = self._displayed_array.shape[0] * self._displayed_array.shape[1] // len(all_ids)
-                return {
-                    "average_size": average_size,
-                    "grain_boundary_length": length
-                }
+            with self._solver_lock:
+                boundary = self._solver.get_boundary()
+            return self._grain_statistics.compute(array, boundary, log, bins)
+
+    def get_compact_labels(self):
+        with self._array_lock:
+            return self._grain_labeling.relabel(self._decode(self._displayed_array))
+
+    def get_fragments(self, connectivity=8):
+        with self._array_lock:
+            array = self._decode(self._displayed_array)
+            with self._solver_lock:
+                wrap = isinstance(self._solver.get_boundary(), PeriodicBoundary)
+            return self._grain_labeling.get_fragments(array, connectivity, wrap)
 
 class ArrayBuilder:
     def __init__(self,
@@ -664,6 +1974,7 @@ class ArrayBuilder:
         self._inclusion_id = inclusion_id
         self._empty_id = 0
         self._seed_ids = set()
+        self._disks = {}
 
     def get_array(self):
         return self._array
@@ -674,32 +1985,48 @@ class ArrayBuilder:
     def new_array(self, height, width):
         self._array = np.zeros((height, width), dtype=np.uint32)
 
-    def remove_fields(self, id_set):
-        def get_proper_array_value(elem):
-            if elem in id_set:
-                return self._empty_id
-            return elem
-        new_array_gen = (get_proper_array_value(elem) for row in self._array for elem in row)
-        new_array = np.array(list(new_array_gen), dtype=np.uint32)
-        new_array.resize(self._array.shape)
+    def remove_fields(self, id_set, boxes=None):
+        new_array = self._array.copy()
+        if boxes is None:
+            ids = np.fromiter(id_set, dtype=np.uint32, count=len(id_set))
+            new_array[np.isin(self._array, ids)] = self._empty_id
+        else:
+            for grain in id_set:
+                if boxes.get(grain) is None:
+                    continue
+                min_row, min_column, max_row, max_column = boxes[grain]
+                window = new_array[min_row:max_row + 1, min_column:max_column + 1]
+                window[window == grain] = self._empty_id
         self._array = new_array
 
-    def add_seed(self, seed_num):
-        empty_fields = sorted(self.get_empty_fields())
-        seed_coords_indices = np.random.choice(np.arange(len(empty_fields)), seed_num)
-        present_seeds = self.get_seed_ids()
-        added_seeds = set()
-        for index in seed_coords_indices:
-            while True:
-                seed = np.random.randint(
-                    self._cmyk_min,
-                    self._cmyk_max,
-                    dtype=np.uint32)
-                if seed not in present_seeds and seed not in added_seeds:
-                    break
-            added_seeds.add(seed)
-            self._array[empty_fields[index]] = seed
-        return added_seeds
+    def _sample_unique(self, low, high, count, excluded=None):
+        samples = np.empty(0, dtype=np.int64)
+        while len(samples) < count:
+            drawn = np.random.randint(low, high, count - len(samples), dtype=np.int64)
+            samples = np.concatenate((samples, drawn))
+            _, first = np.unique(samples, return_index=True)
+            samples = samples[np.sort(first)]
+            if excluded is not None:
+                samples = samples[~np.isin(samples, excluded)]
+        return samples
+
+    def add_seed(self, seed_num, present_seeds=None):
+        empty_fields = np.flatnonzero(self._array == self._empty_id)
+        seed_num = min(seed_num, len(empty_fields))
+        if seed_num * 2 <= len(empty_fields):
+            positions = empty_fields[self._sample_unique(0, len(empty_fields), seed_num)]
+        else:
+            positions = empty_fields[np.random.permutation(len(empty_fields))[:seed_num]]
+        if present_seeds is None:
+            present_seeds = self.get_seed_ids()
+        present_seeds = np.array(sorted(present_seeds), dtype=np.int64)
+        seeds = self._sample_unique(
+            self._cmyk_min,
+            self._cmyk_max,
+            seed_num,
+            present_seeds).astype(np.uint32)
+        self._array.flat[positions] = seeds
+        return set(seeds)
 
     def _horizontal_line(self, x0, y0, y1):
         point_set = set()
@@ -743,59 +2070,88 @@ class ArrayBuilder:
 
         return point_set
 
-    def add_inclusions(self, inclusion_number, min_radius, max_radius):
-        min_index = 0
-        max_height_index = self._array.shape[0] - 1
-        max_width_index = self._array.shape[1] - 1
-
-        empty_fields = self.get_empty_fields()
-        filled_fields = set(self.get_filled_fields())
-
-        empty_filtered_fields = set(
-            field
-            for field in empty_fields
-            if field[0] >= min_index + min_radius
-            and field[0] <= max_height_index - min_radius
-            and field[1] >= min_index + min_radius
-            and field[1] <= max_width_index - min_radius)
-
-        for filled in filled_fields:
-            circle = self.filled_circle(filled[0], filled[1], min_radius)
-            empty_filtered_fields -= circle
-
-        inclusions = set()
-
-        while len(inclusions) < inclusion_number:
-            empty_fields_left = len(empty_filtered_fields)
-            if not empty_fields_left:
-                break
-            field_index = np.random.randint(empty_fields_left)
-            field = list(empty_filtered_fields)[field_index]
-            inclusions.add(field)
-            circle = self.filled_circle(field[0], field[1], min_radius + max_radius)
-            empty_filtered_fields -= circle
-
-        inclusion_circles = set()
+    def _disk(self, radius):
+        if radius not in self._disks:
+            disk = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=bool)
+            rows, columns = zip(*self.filled_circle(radius, radius, radius))
+            disk[rows, columns] = True
+            self._disks[radius] = disk
+        return self._disks[radius]
+
+    def _dilate(self, mask, radius):
+        height, width = mask.shape
+        disk = self._disk(radius)
+        prefix = np.zeros((height, width + 1), dtype=np.int64)
+        np.cumsum(mask, axis=1, out=prefix[:, 1:])
+        prefix = prefix[:, np.clip(np.arange(width + 2 * radius + 1) - radius, 0, width)]
+        dilated = np.zeros_like(mask)
+        for row, line in enumerate(disk):
+            shift = row - radius
+            if abs(shift) >= height:
+                continue
+            half = np.flatnonzero(line).max() - radius
+            spread = prefix[:, radius + half + 1:radius + half + 1 + width] \
+                > prefix[:, radius - half:radius - half + width]
+            if shift >= 0:
+                dilated[:height - shift] |= spread[shift:]
+            else:
+                dilated[-shift:] |= spread[:height + shift]
+        return dilated
+
+    def _disk_window(self, mask, row, column, radius):
+        height, width = mask.shape
+        disk = self._disk(radius)
+        top, left = row - radius, column - radius
+        clipped = disk[
+            max(-top, 0):disk.shape[0] - max(top + disk.shape[0] - height, 0),
+            max(-left, 0):disk.shape[1] - max(left + disk.shape[1] - width, 0)]
+        window = mask[
+            max(top, 0):max(top, 0) + clipped.shape[0],
+            max(left, 0):max(left, 0) + clipped.shape[1]]
+        return window, clipped
 
-        for coords in set(inclusions):
-            inclusions.discard(coords)
+    def add_inclusions(self, inclusion_number, min_radius, max_radius):
+        height, width = self._array.shape
+        filled = self._array != self._empty_id
+
+        candidates_mask = ~self._dilate(filled, min_radius)
+        candidates_mask[:min_radius] = False
+        candidates_mask[height - min_radius:] = False
+        candidates_mask[:, :min_radius] = False
+        candidates_mask[:, width - min_radius:] = False
+
+        candidates = np.flatnonzero(candidates_mask)
+        centers = []
+        while len(centers) < inclusion_number and len(candidates):
+            index = candidates[np.random.randint(len(candidates))]
+            if not candidates_mask.flat[index]:
+                candidates = candidates[candidates_mask.flat[candidates]]
+                continue
+            row, column = divmod(int(index), width)
+            centers.append((row, column))
+            window, disk = self._disk_window(candidates_mask, row, column, min_radius + max_radius)
+            window[disk] = False
+
+        center_mask = np.zeros((height, width), dtype=bool)
+        for row, column in centers:
+            center_mask[row, column] = True
+        occupied = filled.copy()
+
+        for row, column in centers:
+            center_mask[row, column] = False
             radius = np.random.randint(min_radius, max_radius + 1)
-            while True:
-                filled_circle = self.filled_circle(coords[0], coords[1], radius)
-                if filled_circle & filled_fields\
-                or filled_circle & inclusions\
-                or filled_circle & inclusion_circles\
-                or coords[0] + radius > max_height_index\
-                or coords[0] - radius < min_index\
-                or coords[1] + radius > max_width_index\
-                or coords[1] - radius < min_index:
-                    radius -= 1
-                else:
-                    break
-            inclusion_circles |= filled_circle
-
-        for coords in inclusion_circles:
-            self._array[coords] = self._inclusion_id
+            while radius > min_radius:
+                if row - radius >= 0 and row + radius < height \
+                        and column - radius >= 0 and column + radius < width:
+                    window, disk = self._disk_window(occupied, row, column, radius)
+                    centers_window, _ = self._disk_window(center_mask, row, column, radius)
+                    if not (window[disk].any() or centers_window[disk].any()):
+                        break
+                radius -= 1
+            window, disk = self._disk_window(occupied, row, column, radius)
+            window[disk] = True
+            inclusion_window, _ = self._disk_window(self._array, row, column, radius)
+            inclusion_window[disk] = self._inclusion_id
 
     def get_filled_fields(self):
         field_set = (
@@ -814,8 +2170,6 @@ class ArrayBuilder:
         return field_set
 
     def get_seed_ids(self):
-        ids = {
-            x for row in self._array
-            for x in row
-            if x != self._empty_id and x != self._inclusion_id}
+        ids = set(np.unique(self._array).tolist())
+        ids -= {self._empty_id, int(self._inclusion_id)}
         return ids
@@ -120,8 +120,47 @@ class BoundaryRadioMenu(tk.Frame):
             variable=self.boundaryVar,
             value="absorb"
         )
+        self.radioOptReflect = tk.Radiobutton(
+            self,
+            text="reflect",
+            variable=self.boundaryVar,
+            value="reflect"
+        )
         self.radioOptPeriodic.grid(row=1, column=0, sticky=tk.W)
         self.radioOptAbsorb.grid(row=2, column=0, sticky=tk.W)
+        self.radioOptReflect.grid(row=3, column=0, sticky=tk.W)
+
+
+class EngineRadioMenu(tk.Frame):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.label = tk.Label(self, text="Engine")
+        self.label.grid(row=0, column=0, sticky=tk.W+tk.E)
+        self.columnconfigure(0, weight=1)
+
+        self.engineVar = tk.StringVar(self)
+        self.engineVar.set("vectorized")
+        self.radioOptVectorized = tk.Radiobutton(
+            self,
+            text="vectorized",
+            variable=self.engineVar,
+            value="vectorized"
+        )
+        self.radioOptStandard = tk.Radiobutton(
+            self,
+            text="standard",
+            variable=self.engineVar,
+            value="standard"
+        )
+        self.radioOptParallel = tk.Radiobutton(
+            self,
+            text="parallel",
+            variable=self.engineVar,
+            value="parallel"
+        )
+        self.radioOptVectorized.grid(row=1, column=0, sticky=tk.W)
+        self.radioOptStandard.grid(row=2, column=0, sticky=tk.W)
+        self.radioOptParallel.grid(row=3, column=0, sticky=tk.W)
 
 
 class StateRadioMenu(tk.Frame):
@@ -173,17 +212,24 @@ class RadioNeighBoundMenu(tk.Frame):
         self.boundaryMenu.grid(row=4, column=0, sticky=tk.W+tk.E)
         self.separator_3 = ttk.Separator(self, orient=tk.HORIZONTAL)
         self.separator_3.grid(row=5, column=0, rowspan=1, sticky=tk.W+tk.E)
+        self.engineMenu = EngineRadioMenu(self)
+        self.engineMenu.grid(row=6, column=0, sticky=tk.W+tk.E)
+        self.separator_4 = ttk.Separator(self, orient=tk.HORIZONTAL)
+        self.separator_4.grid(row=7, column=0, rowspan=1, sticky=tk.W+tk.E)
 
         self.delayVar = tk.DoubleVar(self)
         self.delayVar.set(0.2)
         self.delayLabel = tk.Label(self, text="Delay:")
-        self.delayLabel.grid(row=6, column=0, sticky=tk.W+tk.E)
+        self.delayLabel.grid(row=8, column=0, sticky=tk.W+tk.E)
         self.delayEntry = tk.Entry(self, textvariable=self.delayVar)
-        self.delayEntry.grid(row=7, column=0, sticky=tk.W)
+        self.delayEntry.grid(row=9, column=0, sticky=tk.W)
 
     def get_boundary(self):
         return self.boundaryMenu.boundaryVar.get()
 
+    def get_engine(self):
+        return self.engineMenu.engineVar.get()
+
     def get_delay(self):
         return self.delayVar.get()
 
@@ -258,9 +304,15 @@ class Menu(tk.Frame):
         self.resetBtn = tk.Button(self, text="Reset", command=self.resetBtnAction, width=8)
         self.resetBtn.grid(row=1, column=2)
 
+        self.stepBackBtn = tk.Button(self, text="Step Back", command=self.stepBackBtnAction, width=8)
+        self.stepBackBtn.grid(row=2, column=0)
+
     def nextStepBtnAction(self):
         self._controller.next_step()
 
+    def stepBackBtnAction(self):
+        self._controller.step_back()
+
     def startStopBtnAction(self):
         self._controller.start_stop()
 
@@ -459,25 +511,29 @@ class Body(tk.Frame):
         boundary = self.radioMenu.get_boundary()
         neighborhood = self.radioMenu.get_neighborhood()
         delay = self.radioMenu.get_delay()
+        engine = self.radioMenu.get_engine()
         state_solver = self.radioMenu.get_state_solver()
         if state_solver == "grain-curvature-probability":
             probability = self.radioMenu.get_state_solver_probability()
             state_solver += ":" + str(probability)
-        self._controller.update_solver(neighborhood, boundary, state_solver)
+        self._controller.update_solver(neighborhood, boundary, state_solver, engine)
         self._controller.update_delay(delay)
 
     def next_step(self):
         self._controller.next_step()
 
+    def step_back(self):
+        self._controller.rewind()
+
     def save(self):
-        files = [('CSV', '*.csv'), ('PNG', '*.png')]
+        files = [('CSV', '*.csv'), ('Binary', '*.cag'), ('PNG', '*.png')]
         filename = filedialog.asksaveasfilename(filetypes=files)
         mode = self.phaseMenu.get_phase()
         if filename:
             self._controller.save(filename, mode)
 
     def load(self):
-        files = [('CSV', '*.csv')]
+        files = [('CSV', '*.csv'), ('Binary', '*.cag')]
         filename = filedialog.askopenfilename(filetypes=files)
         if filename:
             self._controller.load(filename)
@@ -0,0 +1,145 @@
+import numpy as np
+
+
+class GrainLabeling:
+    _connectivity_offsets = {
+        4: ((0, 1), (1, 0)),
+        8: ((0, 1), (1, 0), (1, 1), (1, -1))
+    }
+
+    def __init__(self, inclusion_id=np.uint32(-1)):
+        self._inclusion_id = inclusion_id
+        self._empty_id = 0
+
+    def relabel(self, array):
+        table, labels = np.unique(np.asarray(array, dtype=np.uint32), return_inverse=True)
+        dtype = np.uint16 if len(table) <= np.iinfo(np.uint16).max + 1 else np.uint32
+        return labels.reshape(np.shape(array)).astype(dtype), table
+
+    def restore(self, labels, table):
+        return table[labels]
+
+    def get_grain_labels(self, labels, table):
+        grains = (table != self._empty_id) & (table != self._inclusion_id)
+        return np.flatnonzero(grains)
+
+    def _get_runs(self, array, grains):
+        starts = grains.copy()
+        starts[:, 1:] &= array[:, 1:] != array[:, :-1]
+        return np.cumsum(starts.ravel()).reshape(array.shape) - 1, int(np.count_nonzero(starts))
+
+    def _get_edges(self, array, grains, runs, connectivity, wrap):
+        height, width = array.shape
+        inside = np.ones(array.shape, dtype=bool)
+        first, second = [], []
+        for offset_0, offset_1 in self._connectivity_offsets[connectivity]:
+            shift = (-offset_0, -offset_1)
+            same = grains & (array == np.roll(array, shift, axis=(0, 1)))
+            if not wrap:
+                inside[...] = True
+                inside[height - offset_0:] = False
+                if offset_1 > 0:
+                    inside[:, width - offset_1:] = False
+                elif offset_1 < 0:
+                    inside[:, :-offset_1] = False
+                same &= inside
+            source = runs[same]
+            target = np.roll(runs, shift, axis=(0, 1))[same]
+            apart = source != target
+            first.append(source[apart])
+            second.append(target[apart])
+        first = np.concatenate(first)
+        second = np.concatenate(second)
+        edges = np.unique(np.minimum(first, second) * (array.size + 1) + np.maximum(first, second))
+        return np.divmod(edges, array.size + 1)
+
+    def _hook(self, parent, first, second):
+        while True:
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+            roots_first = parent[first]
+            roots_second = parent[second]
+            apart = roots_first != roots_second
+            if not apart.any():
+                return parent
+            low = np.minimum(roots_first[apart], roots_second[apart])
+            high = np.maximum(roots_first[apart], roots_second[apart])
+            order = np.lexsort((low, high))
+            high, low = high[order], low[order]
+            high, index = np.unique(high, return_index=True)
+            parent[high] = np.minimum(parent[high], low[index])
+
+    def label_components(self, array, connectivity=8, wrap=False):
+        array = np.asarray(array, dtype=np.uint32)
+        grains = (array != self._empty_id) & (array != self._inclusion_id)
+        runs, run_number = self._get_runs(array, grains)
+        first, second = self._get_edges(array, grains, runs, connectivity, wrap)
+        parent = self._hook(np.arange(run_number), first, second)
+        roots = parent[runs[grains]]
+        unique_roots, component_labels = np.unique(roots, return_inverse=True)
+        components = np.full(array.shape, -1, dtype=np.int64)
+        components[grains] = component_labels
+        return components, len(unique_roots)
+
+    def get_fragments(self, array, connectivity=8, wrap=False):
+        array = np.asarray(array, dtype=np.uint32)
+        components, count = self.label_components(array, connectivity, wrap)
+        grains = components >= 0
+        component_ids = np.zeros(count, dtype=np.uint32)
+        component_ids[components[grains]] = array[grains]
+        ids, fragments = np.unique(component_ids, return_counts=True)
+        return {
+            grain: int(fragment_number)
+            for grain, fragment_number in zip(ids.tolist(), fragments.tolist())
+            if fragment_number > 1}
+
+
+class GrainPalette:
+    empty_label = 0
+    inclusion_label = np.iinfo(np.uint16).max
+
+    def __init__(self, inclusion_id=np.uint32(-1)):
+        self._inclusion_id = inclusion_id
+        self.clear()
+
+    def clear(self):
+        self._table = np.zeros(self.inclusion_label + 1, dtype=np.uint32)
+        self._table[self.inclusion_label] = self._inclusion_id
+        self._labels = {0: self.empty_label, int(self._inclusion_id): self.inclusion_label}
+        self._size = 1
+
+    def _add(self, ids):
+        for grain in ids:
+            if grain in self._labels:
+                continue
+            if self._size >= self.inclusion_label:
+                raise ValueError("Too many grains for compact storage")
+            self._labels[grain] = self._size
+            self._table[self._size] = grain
+            self._size += 1
+
+    def encode(self, array):
+        values, inverse = np.unique(np.asarray(array, dtype=np.uint32), return_inverse=True)
+        values = values.tolist()
+        self._add(values)
+        lookup = np.array([self._labels[x] for x in values], dtype=np.uint16)
+        return lookup[inverse].reshape(np.shape(array))
+
+    def decode(self, labels, out=None):
+        return np.take(self._table, labels, out=out)
+
+    def get_labels(self, ids):
+        return [self._labels[int(x)] for x in ids if int(x) in self._labels]
+
+    def get_table(self):
+        return self._table
+
+    def get_ids(self):
+        return self._table[:self._size].copy()
+
+    def set_ids(self, ids):
+        self.clear()
+        self._add(int(x) for x in ids)
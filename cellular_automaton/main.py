@@ -21,6 +21,8 @@ class Main:
         body.columnconfigure(0, weight=0)
         body.reset()
         body.update()
+        self._controller.start_recording(max_frames=1024)
+        self._controller.start_indexing()
 
         separator = ttk.Separator(gui_root, orient=tk.VERTICAL)
         separator.grid(row=0, column=1, sticky=tk.N + tk.S)
@@ -62,6 +64,7 @@ class Main:
             self._on = False
         self._controller.open_gate()
         self._view_thread.join()
+        self._controller.close()
         return 0
 
 if __name__ == '__main__':
@@ -0,0 +1,91 @@
+import argparse
+import os
+import numpy as np
+
+import cellular_automaton.core as core
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m cellular_automaton.run',
+        description='Run a grain growth simulation without the GUI.')
+    parser.add_argument('--height', type=int, default=50)
+    parser.add_argument('--width', type=int, default=100)
+    parser.add_argument('--seeds', type=int, default=3)
+    parser.add_argument('--inclusions', type=int, default=0)
+    parser.add_argument('--inclusion-min-radius', type=int, default=0)
+    parser.add_argument('--inclusion-max-radius', type=int, default=0)
+    parser.add_argument('--neighborhood', default='Moore')
+    parser.add_argument('--boundary', default='periodic')
+    parser.add_argument('--state', default='simple-random-standard')
+    parser.add_argument('--engine', default='vectorized')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-steps', type=int, default=None)
+    parser.add_argument('--random-seed', type=int, default=None)
+    parser.add_argument('--mode', default='single')
+    parser.add_argument('--output', action='append', default=[])
+    parser.add_argument('--frames', default=None)
+    parser.add_argument('--frames-every', type=int, default=1)
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--checkpoint-every', type=int, default=100)
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--compact', action='store_true')
+    return parser.parse_args(argv)
+
+
+def run_with_checkpoints(controller, filename, every, max_steps=None):
+    steps = 0
+    while not controller.is_stable():
+        chunk = every
+        if max_steps is not None:
+            chunk = min(chunk, max_steps - steps)
+        if chunk <= 0:
+            break
+        steps += controller.advance(chunk)
+        controller.save_checkpoint(filename)
+    return steps
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.random_seed is not None:
+        np.random.seed(args.random_seed)
+    controller = core.MainController()
+    try:
+        if args.resume and args.checkpoint and os.path.exists(args.checkpoint):
+            controller.load_checkpoint(args.checkpoint)
+        else:
+            controller.update_solver(
+                args.neighborhood,
+                args.boundary,
+                args.state,
+                args.engine,
+                args.workers)
+            controller.set_compact_storage(args.compact)
+            controller.reset(
+                args.height,
+                args.width,
+                args.seeds,
+                args.inclusions,
+                args.inclusion_min_radius,
+                args.inclusion_max_radius)
+        if args.frames is not None:
+            controller.start_export(args.frames, args.frames_every)
+        if args.checkpoint is None:
+            steps = controller.run_until_stable(args.max_steps)
+        else:
+            steps = run_with_checkpoints(
+                controller,
+                args.checkpoint,
+                args.checkpoint_every,
+                args.max_steps)
+        for filename in args.output:
+            controller.save(filename, args.mode)
+    finally:
+        controller.close()
+    print("steps: {}".format(steps))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
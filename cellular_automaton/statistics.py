@@ -0,0 +1,95 @@
+import numpy as np
+
+from cellular_automaton.labeling import GrainLabeling
+
+
+class GrainStatistics:
+    _edge_offsets = ((0, 1), (1, 0), (0, -1), (-1, 0))
+    _pair_offsets = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+    def __init__(self, inclusion_id=np.uint32(-1)):
+        self._inclusion_id = inclusion_id
+        self._empty_id = 0
+        self._labeling = GrainLabeling(inclusion_id)
+
+    def _pad(self, array, boundary):
+        if boundary is None:
+            return np.pad(array, 1, mode='constant')
+        return boundary.pad(array)
+
+    def _shifted(self, padded, offset, shape):
+        height, width = shape
+        return padded[
+            1 + offset[0]:1 + offset[0] + height,
+            1 + offset[1]:1 + offset[1] + width]
+
+    def _get_perimeters(self, labels, padded_labels, grain_number):
+        perimeters = np.zeros(grain_number, dtype=np.int64)
+        valid = labels >= 0
+        for offset in self._edge_offsets:
+            neighbors = self._shifted(padded_labels, offset, labels.shape)
+            edge = valid & (neighbors != labels)
+            perimeters += np.bincount(labels[edge], minlength=grain_number)
+        return perimeters
+
+    def _get_neighbor_counts(self, labels, padded_labels, grain_number):
+        pairs = []
+        for offset in self._pair_offsets:
+            neighbors = self._shifted(padded_labels, offset, labels.shape)
+            contact = (labels >= 0) & (neighbors >= 0) & (neighbors != labels)
+            first = labels[contact].astype(np.int64)
+            second = neighbors[contact].astype(np.int64)
+            pairs.append(first * grain_number + second)
+            pairs.append(second * grain_number + first)
+        pairs = np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.int64)
+        return np.bincount(pairs // max(grain_number, 1), minlength=grain_number)
+
+    def _get_phase_fractions(self, ids, areas, log, area):
+        phases = {}
+        for phase, log_entry in enumerate(log or ()):
+            for grain in log_entry:
+                phases[int(grain)] = phase
+        grain_phases = np.array([phases.get(x, -1) for x in ids.tolist()], dtype=np.int64)
+        fractions = {}
+        for phase in np.unique(grain_phases).tolist():
+            fractions[phase] = float(areas[grain_phases == phase].sum()) / area
+        return fractions
+
+    def _label(self, array):
+        labels, table = self._labeling.relabel(array)
+        grain_labels = self._labeling.get_grain_labels(labels, table)
+        remap = np.full(len(table), -1, dtype=np.int64)
+        remap[grain_labels] = np.arange(len(grain_labels))
+        return table[grain_labels], remap[labels]
+
+    def get_areas(self, array):
+        ids, labels = self._label(np.asarray(array, dtype=np.uint32))
+        return ids, np.bincount(labels[labels >= 0], minlength=len(ids))
+
+    def compute(self, array, boundary=None, log=None, bins=10):
+        array = np.asarray(array, dtype=np.uint32)
+        area = array.size
+        ids, labels = self._label(array)
+        grain_number = len(ids)
+        padded_labels = self._pad(labels + 1, boundary) - 1
+
+        areas = np.bincount(labels[labels >= 0], minlength=grain_number)
+        if grain_number:
+            histogram, edges = np.histogram(areas, bins)
+            average_size = float(areas.mean())
+        else:
+            histogram, edges = np.zeros(bins, dtype=np.int64), np.zeros(bins + 1)
+            average_size = 0.0
+        return {
+            "grain_number": grain_number,
+            "ids": ids,
+            "areas": areas,
+            "average_size": average_size,
+            "equivalent_diameters": 2 * np.sqrt(areas / np.pi),
+            "size_histogram": (histogram, edges),
+            "perimeters": self._get_perimeters(labels, padded_labels, grain_number),
+            "neighbor_counts": self._get_neighbor_counts(labels, padded_labels, grain_number),
+            "phase_fractions": self._get_phase_fractions(ids, areas, log, area),
+            "empty_fraction": float(np.count_nonzero(array == self._empty_id)) / area,
+            "inclusion_fraction": float(np.count_nonzero(array == self._inclusion_id)) / area
+        }
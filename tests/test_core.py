@@ -1,7 +1,7 @@
 import numpy as np
 import cellular_automaton.core as core
 import os
-from copy import deepcopy
+import pytest
 
 class TestNeighborhood:
     def test_moore(self):
@@ -54,6 +54,20 @@ class TestNeighborhood:
         valid_neighbors = {(0, 0), (0, 1), (1, 0), (2, 0), (2, 1)}
         assert neighbors == valid_neighbors
 
+    def test_get_offsets(self):
+        neumann = core.NeumannNeighborhood()
+        offsets = neumann.get_offsets(5)
+        assert offsets.shape == (1, 4, 2)
+        assert set(map(tuple, offsets[0])) == {(-1, 0), (0, -1), (0, 1), (1, 0)}
+
+    def test_get_offsets_random(self):
+        hexagonal_random = core.HexagonalRandom()
+        np.random.seed(7)
+        offsets = hexagonal_random.get_offsets(4)
+        np.random.seed(7)
+        neighbors = [hexagonal_random.get_neighbors(0, 0) for _ in range(4)]
+        assert np.array_equal(offsets, np.array(neighbors))
+
 class TestSolver:
     def test_next_step(self):
         neighborhood = core.MooreNeighborhood()
@@ -106,6 +120,223 @@ class TestSolver:
         length = solver.get_boundary_length(array)
         assert length == 6
 
+    def test_get_bound_array(self):
+        neighborhood = core.MooreNeighborhood()
+        state_solver = core.SimpleStateSolver()
+        boundary = core.PeriodicBoundary()
+        solver = core.Solver(neighborhood, boundary, state_solver)
+        array = np.array([
+            [1, 1, 2, 2],
+            [1, 1, 2, 2],
+            [1, 1, 2, 2]], dtype=np.uint32)
+        assert np.array_equal(solver.get_bound_array(array), np.ones((3, 4)))
+        array[:, 0] = 2
+        assert np.array_equal(solver.get_bound_array(array), np.array([
+            [1, 1, 1, 0],
+            [1, 1, 1, 0],
+            [1, 1, 1, 0]]))
+
+class TestVectorizedSolver:
+    def test_next_step(self):
+        neighborhood = core.MooreNeighborhood()
+        state_solver = core.SimpleStateSolver()
+        boundary = core.PeriodicBoundary()
+        solver = core.VectorizedSolver(neighborhood, boundary, state_solver)
+        array = np.array([
+            [0,0,0,0],
+            [0,0,0,0],
+            [0,0,1,0],
+            [0,0,0,0]])
+        new_array = solver.next_step(array)
+        assert np.array_equal(new_array, np.array([
+            [0,0,0,0],
+            [0,1,1,1],
+            [0,1,1,1],
+            [0,1,1,1]]))
+
+    def test_next_step_absorb(self):
+        neighborhood = core.NeumannNeighborhood()
+        state_solver = core.SimpleStateSolver()
+        boundary = core.AbsorbBoundary()
+        solver = core.VectorizedSolver(neighborhood, boundary, state_solver)
+        array = np.array([
+            [1,0,0],
+            [0,0,0],
+            [0,0,0]], dtype=np.uint32)
+        new_array = solver.next_step(array)
+        assert np.array_equal(new_array, np.array([
+            [1,1,0],
+            [1,0,0],
+            [0,0,0]]))
+
+    def test_get_frontier(self):
+        neighborhood = core.NeumannNeighborhood()
+        state_solver = core.SimpleStateSolver()
+        boundary = core.AbsorbBoundary()
+        solver = core.VectorizedSolver(neighborhood, boundary, state_solver)
+        array = np.array([
+            [1,0,0,0],
+            [0,0,0,0],
+            [0,0,0,0]], dtype=np.uint32)
+        array = solver.next_step(array)
+        assert np.array_equal(solver.get_frontier(), [2, 5, 6, 8, 9])
+        array = solver.next_step(array)
+        assert np.array_equal(solver.get_frontier(), [3, 6, 7, 9, 10])
+        array[2, 3] = 2
+        solver.invalidate()
+        array = solver.next_step(array)
+        assert np.array_equal(array, np.array([
+            [1,1,1,1],
+            [1,1,1,2],
+            [1,1,2,2]]))
+
+    def test_get_step_info(self):
+        creator = core.SolverCreator()
+        for engine in ("standard", "vectorized"):
+            solver = creator.create("Neumann", "absorb", engine=engine)
+            array = np.array([
+                [1, 0, 0],
+                [0, 0, 0]], dtype=np.uint32)
+            array = solver.next_step(array)
+            assert solver.get_step_info() == {
+                "changed_cells": 2, "empty_cells": 3, "stable": False}
+            for _ in range(3):
+                array = solver.next_step(array)
+            assert solver.get_step_info() == {
+                "changed_cells": 0, "empty_cells": 0, "stable": True}
+
+    def test_next_step_out(self):
+        creator = core.SolverCreator()
+        solver = creator.create("Neumann", "absorb", engine="vectorized")
+        array = np.zeros((3, 4), dtype=np.uint32)
+        array[0, 0] = 1
+        buffers = (array, np.zeros((3, 4), dtype=np.uint32))
+        expected = creator.create("Neumann", "absorb").next_step(array)
+        first = solver.next_step(buffers[0], buffers[1])
+        assert first is buffers[1]
+        assert np.array_equal(first, expected)
+        second = solver.next_step(buffers[1], buffers[0])
+        assert second is buffers[0]
+        assert np.array_equal(second, creator.create("Neumann", "absorb").next_step(expected))
+
+    def test_advance(self):
+        creator = core.SolverCreator()
+        solver = creator.create("Moore", "periodic", engine="vectorized")
+        reference = creator.create("Moore", "periodic", engine="vectorized")
+        array = np.zeros((9, 11), dtype=np.uint32)
+        array[1, 2] = 1
+        array[6, 7] = 2
+        expected = array
+        np.random.seed(7)
+        for _ in range(3):
+            expected = reference.next_step(expected)
+        generations = []
+        np.random.seed(7)
+        new_array, generation = solver.advance(
+            array, 3, every=2, callback=lambda number, _: generations.append(number))
+        assert generation == 3
+        assert generations == [2]
+        assert np.array_equal(new_array, expected)
+        assert array.sum() == 3
+        new_array, generation = solver.advance(new_array, 100)
+        assert generation < 100
+        assert new_array.all()
+
+    def test_compact_dtype(self):
+        creator = core.SolverCreator()
+        array = np.zeros((9, 11), dtype=np.uint32)
+        array[1, 2] = 1
+        array[6, 7] = 2
+        np.random.seed(7)
+        expected, _ = creator.create("Moore", "periodic").advance(array, 3)
+        np.random.seed(7)
+        compact, _ = creator.create("Moore", "periodic").advance(array.astype(np.uint16), 3)
+        assert compact.dtype == np.uint16
+        assert np.array_equal(compact, expected)
+        compact = creator.create("Moore", "periodic", engine="standard").next_step(array.astype(np.uint16))
+        assert compact.dtype == np.uint16
+
+    def test_track_boundary(self):
+        creator = core.SolverCreator()
+        solver = creator.create("Moore", "absorb", engine="vectorized", track_boundary=True)
+        reference = creator.create("Moore", "absorb")
+        array = np.zeros((10, 12), dtype=np.uint32)
+        array[2, 3] = 1
+        array[7, 9] = 2
+        for _ in range(5):
+            previous_array = array
+            array = solver.next_step(array)
+            for checked_array in (previous_array, array):
+                assert np.array_equal(
+                    solver.get_bound_array(checked_array),
+                    reference.get_bound_array(checked_array))
+                assert solver.get_boundary_length(checked_array) \
+                    == reference.get_boundary_length(checked_array)
+
+    def test_same_as_standard(self):
+        creator = core.SolverCreator()
+        for state in ("simple-random-standard", "grain-curvature-probability:0"):
+            for boundary in ("periodic", "absorb"):
+                standard = creator.create("Moore", boundary, state)
+                vectorized = creator.create("Moore", boundary, state, "vectorized")
+                array = np.zeros((12, 15), dtype=np.uint32)
+                array[::4, ::5] = [[1, 2, 3], [2, 3, 1], [3, 1, 2]]
+                standard_array = array
+                vectorized_array = array
+                for _ in range(6):
+                    np.random.seed(7)
+                    standard_array = standard.next_step(standard_array)
+                    np.random.seed(7)
+                    vectorized_array = vectorized.next_step(vectorized_array)
+                    assert np.array_equal(standard_array, vectorized_array)
+
+
+class TestParallelSolver:
+    def test_same_as_vectorized(self):
+        creator = core.SolverCreator()
+        for boundary in ("periodic", "absorb"):
+            vectorized = creator.create("Moore", boundary, engine="vectorized")
+            parallel = core.ParallelSolver(
+                core.MooreNeighborhood(),
+                vectorized._boundary,
+                core.SimpleStateSolver(),
+                workers=2,
+                min_parallel_cells=0)
+            array = np.zeros((16, 12), dtype=np.uint32)
+            array[::5, ::4] = [[1, 2, 3], [2, 3, 1], [3, 1, 2], [1, 3, 2]]
+            vectorized_array = array
+            parallel_array = array
+            try:
+                for _ in range(6):
+                    np.random.seed(7)
+                    vectorized_array = vectorized.next_step(vectorized_array)
+                    np.random.seed(7)
+                    parallel_array = parallel.next_step(parallel_array)
+                    assert np.array_equal(vectorized_array, parallel_array)
+            finally:
+                parallel.close()
+
+    def test_add_ignored_ids(self):
+        parallel = core.ParallelSolver(
+            core.MooreNeighborhood(),
+            core.AbsorbBoundary(),
+            core.SimpleStateSolver(),
+            workers=2,
+            min_parallel_cells=0)
+        array = np.zeros((16, 12), dtype=np.uint32)
+        array[2, 2] = 1
+        array[12, 8] = 2
+        try:
+            array = parallel.next_step(array)
+            parallel.add_ignored_ids([1])
+            assert parallel._pool is None
+            array = parallel.next_step(array)
+            assert np.count_nonzero(array == 1) == 9
+            assert np.count_nonzero(array == 2) == 25
+        finally:
+            parallel.close()
+
+
 class TestSimpleStateSolver:
     def test_next_elem(self):
         array = np.array([
@@ -120,6 +351,45 @@ class TestSimpleStateSolver:
         new_state = state_solver.get_next_state(array[(1,1)], neighbors_1_1)
         assert new_state == 1
 
+    def test_next_elem_majority(self):
+        state_solver = core.SimpleStateSolver()
+        assert state_solver.get_next_state(0, [2, 1, 1, 3, 0, 0]) == 1
+
+    def test_next_states(self):
+        state_solver = core.SimpleStateSolver()
+        state_solver.ignore_ids([5])
+        neighbors = np.array([
+            [0, 0, 0, 0],
+            [2, 1, 1, 3],
+            [5, 5, 5, 4],
+            [0, 7, 0, 0]
+        ], dtype=np.uint32)
+        assert np.array_equal(state_solver.get_next_states(neighbors), [0, 1, 4, 7])
+
+    def test_next_states_ties(self):
+        state_solver = core.SimpleStateSolver()
+        neighbors = np.array([
+            [1, 2, 3, 0],
+            [4, 4, 5, 5],
+            [6, 7, 7, 6]
+        ], dtype=np.uint32)
+        np.random.seed(3)
+        states = state_solver.get_next_states(neighbors)
+        np.random.seed(3)
+        single_states = [state_solver.get_next_state(0, row) for row in neighbors]
+        assert np.array_equal(states, single_states)
+
+    def test_decide_states(self):
+        state_solver = core.SimpleStateSolver()
+        neighbors = np.array([
+            [0, 0, 0, 0],
+            [2, 1, 1, 3],
+            [2, 2, 4, 4]
+        ], dtype=np.uint32)
+        states, undecided = state_solver.decide_states(neighbors)
+        assert np.array_equal(states[:2], [0, 1])
+        assert np.array_equal(undecided, [False, False, True])
+
     def test_ignore_ids(self):
         solver = core.SimpleStateSolver()
         assert solver._ignored_ids == {0, 0xffffffff}
@@ -154,6 +424,28 @@ class TestGrainCurvatureStateSolver:
         solver._probability = 0.07
         assert solver.get_next_state(state, neighbors) == 0
 
+    def test_next_states(self):
+        solver = core.GrainCurvatureStateSolver(probability=0)
+        neighbors = np.array([
+            [1, 1, 1, 1, 0, 1, 0, 0],
+            [2, 1, 0, 1, 3, 0, 1, 0],
+            [2, 0, 2, 0, 0, 3, 0, 2],
+            [0, 1, 0, 1, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0]
+        ], dtype=np.uint32)
+        assert np.array_equal(solver.get_next_states(neighbors), [1, 1, 2, 0, 0])
+        states, undecided = solver.decide_states(neighbors)
+        assert np.array_equal(undecided, [False, False, False, True, False])
+        solver._probability = 1
+        assert solver.get_next_states(neighbors)[3] == 1
+
+    def test_can_change(self):
+        solver = core.GrainCurvatureStateSolver(probability=0.5)
+        neighbors = np.array([[0, 1, 0, 0, 0, 0, 0, 0]], dtype=np.uint32)
+        assert solver.can_change(neighbors)
+        solver._probability = 0
+        assert not solver.can_change(neighbors)
+
     def test_rule_five_more(self):
         solver = core.GrainCurvatureStateSolver()
         quantity = {
@@ -222,6 +514,25 @@ class TestPeriodicBoundary:
         assert 1 == boundary.get_value((100, 50), array, height, width)
         assert 1 == boundary.get_value((5, 5), array, height, width)
 
+    def test_pad(self):
+        boundary = core.PeriodicBoundary()
+        array = np.arange(6).reshape(2, 3)
+        padded = boundary.pad(array)
+        assert np.array_equal(padded, np.array([
+            [5, 3, 4, 5, 3],
+            [2, 0, 1, 2, 0],
+            [5, 3, 4, 5, 3],
+            [2, 0, 1, 2, 0]]))
+        padded[1, 1] = 9
+        boundary.update_halo(padded)
+        assert padded[3, 1] == 9 and padded[1, 4] == 9 and padded[3, 4] == 9
+
+    def test_get_indices(self):
+        boundary = core.PeriodicBoundary()
+        rows, columns = boundary.get_indices(np.array([-1, 2]), np.array([3, 0]), 2, 3)
+        assert np.array_equal(rows, [1, 0])
+        assert np.array_equal(columns, [0, 0])
+
 
 class TestAbsorbBoundary:
     def test_get_boundary(self):
@@ -233,6 +544,45 @@ class TestAbsorbBoundary:
         assert 0 == boundary.get_value((100, 50), array, height, width)
         assert 1 == boundary.get_value((5, 5), array, height, width)
 
+    def test_pad(self):
+        boundary = core.AbsorbBoundary()
+        array = np.ones((2, 2))
+        assert np.array_equal(boundary.pad(array), np.array([
+            [0, 0, 0, 0],
+            [0, 1, 1, 0],
+            [0, 1, 1, 0],
+            [0, 0, 0, 0]]))
+
+    def test_get_indices(self):
+        boundary = core.AbsorbBoundary()
+        rows, columns = boundary.get_indices(np.array([-1, 1]), np.array([0, 2]), 2, 3)
+        assert np.array_equal(rows, [1])
+        assert np.array_equal(columns, [2])
+
+
+class TestReflectBoundary:
+    def test_get_boundary(self):
+        boundary = core.ReflectBoundary()
+        height = 100
+        width = 50
+        array = np.eye(100, 50, 0, np.int32)
+        assert 1 == boundary.get_value((-1, -1), array, height, width)
+        assert 0 == boundary.get_value((100, 48), array, height, width)
+        assert 1 == boundary.get_value((5, 5), array, height, width)
+
+    def test_pad(self):
+        boundary = core.ReflectBoundary()
+        array = np.arange(6).reshape(2, 3)
+        padded = boundary.pad(array)
+        assert np.array_equal(padded, np.array([
+            [0, 0, 1, 2, 2],
+            [0, 0, 1, 2, 2],
+            [3, 3, 4, 5, 5],
+            [3, 3, 4, 5, 5]]))
+        padded[1, 1] = 9
+        boundary.update_halo(padded)
+        assert padded[0, 0] == 9 and padded[0, 1] == 9 and padded[1, 0] == 9
+
 
 class TestSolverCreator:
     def test_create(self):
@@ -246,6 +596,9 @@ class TestSolverCreator:
         assert isinstance(solver._boundary, core.PeriodicBoundary)
         assert isinstance(solver._state_solver, core.GrainCurvatureStateSolver)
         assert solver._state_solver._probability == 0.4
+        solver = creator.create("Moore", "reflect", engine="vectorized")
+        assert isinstance(solver, core.VectorizedSolver)
+        assert isinstance(solver._boundary, core.ReflectBoundary)
 
 
 class TestMainController:
@@ -258,6 +611,9 @@ class TestMainController:
         assert isinstance(
             controller._solver._boundary,
             core.AbsorbBoundary)
+        assert not isinstance(controller._solver, core.VectorizedSolver)
+        controller.update_solver("Moore", "periodic", engine="vectorized")
+        assert isinstance(controller._solver, core.VectorizedSolver)
 
     def test_update_delay(self):
         controller = core.MainController()
@@ -273,6 +629,22 @@ class TestMainController:
         array = next(arrays)
         assert np.array_equal(array, np.zeros((3, 3), np.int32))
 
+    def test_array_generator_buffers(self):
+        controller = core.MainController()
+        controller._array = np.zeros((3, 3), np.uint32)
+        controller._array[1, 1] = 1
+        arrays = controller.array_generator()
+        first = next(arrays)
+        second = next(arrays)
+        third = next(arrays)
+        fourth = next(arrays)
+        assert first[1, 1] == 1 and first.sum() == 1
+        assert np.array_equal(second, np.ones((3, 3)))
+        assert np.array_equal(third, np.ones((3, 3)))
+        assert not second.flags.writeable
+        assert fourth is third
+        assert controller._array is controller._buffers[1]
+
     def test_array_solver_function(self):
         controller = core.MainController()
         array = np.array([
@@ -287,7 +659,7 @@ class TestMainController:
         controller = core.MainController()
         assert controller._loop_mode_function == controller._array_solver_function
         controller._set_loop_mode('vision')
-        assert controller._loop_mode_function == deepcopy
+        assert controller._loop_mode_function == controller._array_vision_function
 
     def test_reset(self):
         controller = core.MainController()
@@ -302,6 +674,33 @@ class TestMainController:
         ])
         assert np.array_equal(array, good_array)
 
+    def test_run_until_stable(self):
+        controller = core.MainController()
+        controller._array = np.array([
+            [1, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0]
+        ], dtype=np.uint32)
+        assert controller.run_until_stable(1) == 1
+        assert controller._displayed_array[1, 1] == 1
+        assert not controller.is_stable()
+        assert controller.run_until_stable() == 2
+        assert np.array_equal(controller._displayed_array, np.ones((3, 5)))
+        assert controller.is_stable()
+        assert controller.run_until_stable() == 0
+
+    def test_advance(self):
+        controller = core.MainController()
+        controller._array = np.array([
+            [1, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0]
+        ], dtype=np.uint32)
+        assert controller.advance(2) == 2
+        assert np.array_equal(controller._displayed_array, np.array([
+            [1, 1, 1, 0, 1, 1],
+            [1, 1, 1, 0, 1, 1]
+        ]))
+
     def test_clear(self):
         controller = core.MainController()
         controller._array = np.array([
@@ -396,7 +795,7 @@ class TestMainController:
     def test_next_vision_step(self):
         controller = core.MainController()
         controller.next_vision_step()
-        assert controller._loop_mode_function == deepcopy
+        assert controller._loop_mode_function == controller._array_vision_function
 
     def test_start_stop(self):
         controller = core.MainController()
@@ -437,6 +836,27 @@ class TestMainController:
         array.extend(lines)
         assert np.array_equal(np.array(array, dtype=np.uint32), controller._displayed_array)
 
+    def test_save_copies_grid(self):
+        controller = core.MainController()
+        np.random.seed(7)
+        controller.reset(10, 10, 3)
+        generator = controller.array_generator()
+        next(generator)
+        next(generator)
+        expected = next(generator).copy()
+        saved = []
+
+        def save(filename, array, log, mode, bound_array):
+            next(generator)
+            next(generator)
+            saved.append((array.copy(), bound_array.copy()))
+
+        controller._csv_file.save = save
+        controller.save('test.save.core.main.controller.csv')
+        array, bound_array = saved[0]
+        assert np.array_equal(array, expected)
+        assert np.array_equal(bound_array, controller._solver.get_bound_array(expected))
+
     def test_load(self):
         controller = core.MainController()
         filecontent = """1,1,1
@@ -457,6 +877,222 @@ class TestMainController:
         os.remove(filename)
         assert np.array_equal(good_array, controller._array)
 
+    def test_save_load_binary(self):
+        controller = core.MainController()
+        controller._displayed_array = np.array([
+                [1, 1, 2],
+                [1, 1, 2],
+                [3, 3, 2]
+            ], dtype=np.uint32)
+        controller._grain_history.log_grains([1, 2])
+        controller._grain_history.new_phase()
+        controller._grain_history.log_grains([3])
+        filename = 'test.save.core.main.controller.cag'
+        controller.save(filename, 'dual')
+        loaded = core.MainController()
+        loaded.load(filename)
+        os.remove(filename)
+        assert np.array_equal(loaded._array, controller._displayed_array)
+        assert loaded._grain_history.get_log() == [(1, 2), {3}]
+
+    def test_export(self):
+        controller = core.MainController()
+        np.random.seed(7)
+        controller.reset(10, 10, 3)
+        filename = 'test.core.main.controller.export.npz'
+        controller.start_export(filename)
+        frames = [next(controller.array_generator()) for _ in range(3)]
+        generation = controller.run_until_stable()
+        controller.stop_export()
+        exported = list(core.FrameExporter.read_frames(filename))
+        os.remove(filename)
+        assert len(exported) == 4 + generation
+        for (_, frame), expected in zip(exported[1:3], frames[1:]):
+            assert np.array_equal(frame, expected)
+        assert np.array_equal(exported[-1][1], controller._array)
+
+    def test_export_every(self):
+        controller = core.MainController()
+        controller.update_solver("Moore", "absorb")
+        np.random.seed(7)
+        controller.reset(30, 30, 3)
+        controller.start_recording()
+        filename = 'test.core.main.controller.export.every.npz'
+        controller.start_export(filename, every=2)
+        frames = []
+        controller._solver.advance = self._checked_advance(controller._solver.advance, frames)
+        assert controller.advance(5) == 5
+        controller.stop_export()
+        exported = list(core.FrameExporter.read_frames(filename))
+        os.remove(filename)
+        assert frames == [False] * 5
+        assert [generation for generation, _ in exported] == [0, 2, 4]
+        history = controller.get_history()
+        for generation, frame in exported:
+            assert np.array_equal(frame, history.get_frame(generation))
+
+    def _checked_advance(self, advance, frames):
+        def checked(array, steps, every=None, callback=None, record=None):
+            def checked_record(frame):
+                frames.append(frame.flags.writeable)
+                record(frame)
+            return advance(array, steps, every, callback, checked_record)
+        return checked
+
+    def test_vision_step_keeps_buffers(self):
+        controller = core.MainController()
+        controller.update_solver("Moore", "absorb", engine="vectorized")
+        np.random.seed(7)
+        controller.reset(20, 20, 3)
+        generator = controller.array_generator()
+        next(generator)
+        next(generator)
+        buffers = controller._buffers
+        expected = controller._array.copy()
+        resets = []
+        reset_frontier = controller._solver._reset_frontier
+        controller._solver._reset_frontier = lambda array: resets.append(reset_frontier(array))
+        controller.next_vision_step()
+        assert np.array_equal(next(generator), expected)
+        next(generator)
+        assert controller._buffers is buffers
+        assert resets == []
+
+    def test_rewind(self):
+        controller = core.MainController()
+        np.random.seed(7)
+        controller.reset(10, 10, 3)
+        controller.start_recording(keyframe_interval=2)
+        arrays = [controller._array.copy()]
+        generator = controller.array_generator()
+        for _ in range(4):
+            next(generator)
+            arrays.append(controller._array.copy())
+        assert controller.rewind(2) == 2
+        assert np.array_equal(controller._array, arrays[2])
+        assert np.array_equal(next(generator), arrays[2])
+        assert len(controller.get_history()) == 3
+        generation = controller.advance(5)
+        history = controller.stop_recording()
+        assert len(history) == 3 + generation
+        assert np.array_equal(history.get_frame(-1), controller._array)
+
+    def test_rewind_generation(self):
+        controller = core.MainController()
+        controller.update_solver("Moore", "absorb")
+        np.random.seed(7)
+        controller.reset(30, 30, 3)
+        controller.start_recording()
+        assert controller.advance(6) == 6
+        assert controller.get_generation() == 6
+        controller.rewind(3)
+        assert controller.get_generation() == 3
+        filename = 'test.core.main.controller.rewind.npz'
+        controller.save_checkpoint(filename)
+        restored = core.MainController()
+        restored.load_checkpoint(filename)
+        os.remove(filename)
+        assert restored.get_generation() == 3
+        assert np.array_equal(restored._array, controller._array)
+
+    def test_checkpoint(self):
+        controller = core.MainController()
+        controller.update_solver("Moore", "absorb", "grain-curvature-probability:0.5")
+        np.random.seed(7)
+        controller.reset(30, 30, 6)
+        controller.advance(3)
+        controller.select_field(5)
+        filename = 'test.core.main.controller.checkpoint.npz'
+        controller.save_checkpoint(filename)
+        checkpoint = controller._array.copy()
+        controller.advance(4)
+        expected = controller._array.copy()
+        assert not np.array_equal(checkpoint, expected)
+        restored = core.MainController()
+        restored.load_checkpoint(filename)
+        os.remove(filename)
+        assert restored.get_generation() == 3
+        assert restored.get_selected() == {5}
+        assert restored._grain_history.get_log() == controller._grain_history.get_log()
+        assert restored._solver.get_ignored_ids() == controller._solver.get_ignored_ids()
+        assert restored._solver_config[2] == "grain-curvature-probability:0.5"
+        restored.advance(4)
+        assert restored.get_generation() == controller.get_generation()
+        assert np.array_equal(restored._array, expected)
+
+    def test_compact_storage(self):
+        controller = core.MainController()
+        controller.update_solver("Moore", "absorb")
+        controller.set_compact_storage()
+        controller.start_indexing()
+        np.random.seed(7)
+        controller.reset(20, 20, 5, 2, 1, 2)
+        generator = controller.array_generator()
+        next(generator)
+        controller.advance(3)
+        array = next(generator)
+        assert controller._array.dtype == np.uint16
+        assert array.dtype == np.uint32
+        assert set(np.unique(array)) <= {0, np.uint32(-1)} | controller._grain_history.get_log()[0]
+        grain = sorted(controller._grain_history.get_log()[0])[0]
+        current = controller._palette.decode(controller._array)
+        assert controller.get_grain_info(grain)["cells"] == np.count_nonzero(current == grain)
+        filename = 'test.core.main.controller.compact.npz'
+        controller.save_checkpoint(filename)
+        controller.advance(3)
+        expected = next(generator)
+        restored = core.MainController()
+        restored.load_checkpoint(filename)
+        os.remove(filename)
+        assert restored._array.dtype == np.uint16
+        restored.advance(3)
+        assert np.array_equal(next(restored.array_generator()), expected)
+        current = controller._palette.decode(controller._array)
+        controller.set_compact_storage(False)
+        assert controller._array.dtype == np.uint32
+        assert np.array_equal(controller._array, current)
+
+    def test_compact_storage_new_phase_reset(self):
+        controller = core.MainController()
+        controller.set_compact_storage()
+        np.random.seed(7)
+        controller.reset(30, 30, 5)
+        controller.advance(3)
+        controller.new_phase()
+        controller.reset(30, 30, 5)
+        controller.advance(100)
+        assert controller._array.all()
+        filename = 'test.core.main.controller.compact.cag'
+        controller.new_phase()
+        controller.save(filename)
+        controller.load(filename)
+        os.remove(filename)
+        labels = controller._palette.get_labels(controller._grain_history.get_log()[0])
+        assert controller._solver.get_ignored_ids() >= set(labels)
+        assert not controller._solver.get_ignored_ids() & set(range(len(labels) + 1, 65535))
+
+    def test_get_grain_info(self):
+        controller = core.MainController()
+        assert controller.get_grain_info(1) is None
+        controller._array = np.array([
+            [1, 0, 0, 0, 0],
+            [0, 0, 0, 0, 2],
+            [0, 0, 0, 0, 0]
+        ], dtype=np.uint32)
+        controller._grain_history.log_grains([1, 2])
+        controller.update_solver("Moore", "absorb")
+        controller.start_indexing()
+        controller.advance(1)
+        assert controller.get_grain_info(1) == {
+            "cells": 4,
+            "bounding_box": (0, 0, 1, 1),
+            "phase": 0
+        }
+        controller.select_field(2)
+        controller.remove_selected_fields()
+        assert controller.get_grain_info(2)["cells"] == 0
+        assert controller.get_grain_info(1)["cells"] == 4
+
     def test_new_phase(self):
         controller = core.MainController()
         controller._array = np.array([
@@ -491,6 +1127,207 @@ class TestMainController:
             "average_size": 10
         }
 
+    def test_get_grain_statistics(self):
+        controller = core.MainController()
+        controller._displayed_array = np.array([
+            [2, 2, 3],
+            [0, 2, 3]
+        ], dtype=np.uint32)
+        controller._grain_history.log_grains([2, 3, 4, 5])
+        statistics = controller.get_statistics()
+        assert statistics["average_size"] == 2
+        controller._array = controller._displayed_array
+        controller.start_indexing()
+        assert controller.get_statistics()["average_size"] == 2
+        assert controller._grain_index.is_valid()
+        controller._array = np.full((2, 3), 2, dtype=np.uint32)
+        controller._grain_index.rebuild(controller._array)
+        assert controller.get_statistics()["average_size"] == 2
+        grain_statistics = controller.get_grain_statistics()
+        assert np.array_equal(grain_statistics["areas"], [3, 2])
+        assert grain_statistics["phase_fractions"] == {0: 5 / 6}
+
+    def test_get_fragments(self):
+        controller = core.MainController()
+        controller._displayed_array = np.array([
+            [5, 0, 0, 5],
+            [0, 0, 0, 0]
+        ], dtype=np.uint32)
+        assert controller.get_fragments() == {}
+        controller.update_solver("Moore", "absorb")
+        assert controller.get_fragments() == {5: 2}
+        labels, table = controller.get_compact_labels()
+        assert np.array_equal(table[labels], controller._displayed_array)
+
+class TestCsvGridFile:
+    def test_save(self):
+        csv_file = core.CsvGridFile()
+        array = np.array([
+            [1, 1, 20],
+            [300, 1, 20]
+        ], dtype=np.uint32)
+        bound_array = np.array([
+            [0, 1, 1],
+            [1, 1, 1]
+        ], dtype=np.uint32)
+        filename = 'test.save.core.csv.grid.file.csv'
+        csv_file.save(filename, array, [(1, 20), {300}], 'dual', bound_array)
+        with open(filename) as f:
+            content = f.read()
+        os.remove(filename)
+        assert content == (
+            "1,1,20\n"
+            "300,1,20\n"
+            "#grains:[(1, 20), {300}]:dual\n"
+            "#b 0,1,1\n"
+            "#b 1,1,1\n")
+
+    def test_load(self):
+        csv_file = core.CsvGridFile()
+        csv_file._chunk_rows = 2
+        array = np.arange(15, dtype=np.uint32).reshape(5, 3)
+        filename = 'test.load.core.csv.grid.file.csv'
+        csv_file.save(filename, array, [(1,), (2, 3), {4, 5}], 'single', array % 2)
+        loaded, log, mode, bound_array = csv_file.load(filename)
+        os.remove(filename)
+        assert np.array_equal(loaded, array)
+        assert np.array_equal(bound_array, array % 2)
+        assert log == [(1,), (2, 3), {4, 5}]
+        assert mode == 'single'
+
+    def test_parse_log(self):
+        csv_file = core.CsvGridFile()
+        assert csv_file.parse_log("[]") == []
+        assert csv_file.parse_log("[(np.uint32(3), 4), {np.uint32(5)}]") == [(3, 4), {5}]
+        with pytest.raises(ValueError):
+            csv_file.parse_log("__import__('os').getcwd()")
+
+
+class TestBinaryGridFile:
+    def test_save_load(self):
+        binary_file = core.BinaryGridFile()
+        array = np.arange(35, dtype=np.uint32).reshape(5, 7)
+        bound_array = (array % 3 == 0).astype(np.uint32)
+        filename = 'test.save.core.binary.grid.file.cag'
+        binary_file.save(filename, array, [(1, 2), {5, 4}], 'dual', bound_array)
+        loaded, log, mode, loaded_bound = binary_file.load(filename)
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, array)
+        assert np.array_equal(loaded_bound, bound_array)
+        assert log == [(1, 2), {4, 5}]
+        assert mode == 'dual'
+        loaded[0, 0] = 9
+        copied, _, _, _ = binary_file.load(filename, mmap=False)
+        del loaded
+        os.remove(filename)
+        assert copied[0, 0] == 0
+        assert not isinstance(copied, np.memmap)
+
+    def test_save_without_boundary(self):
+        binary_file = core.BinaryGridFile()
+        filename = 'test.save.core.binary.grid.file.empty.cag'
+        binary_file.save(filename, np.ones((2, 3), dtype=np.uint32), [], 'single')
+        loaded, log, mode, bound_array = binary_file.load(filename, mmap=False)
+        os.remove(filename)
+        assert np.array_equal(loaded, np.ones((2, 3)))
+        assert log == []
+        assert bound_array is None
+
+
+class TestFrameExporter:
+    def test_add(self):
+        filename = 'test.core.frame.exporter.npz'
+        exporter = core.FrameExporter(filename, every=2, chunk_frames=2, queue_size=1)
+        arrays = [np.full((3, 4), x, dtype=np.uint32) for x in range(7)]
+        for array in arrays:
+            exporter.add(array)
+        exporter.close()
+        frames = list(core.FrameExporter.read_frames(filename))
+        os.remove(filename)
+        assert [generation for generation, _ in frames] == [0, 2, 4, 6]
+        for generation, frame in frames:
+            assert frame.dtype == np.uint32
+            assert np.array_equal(frame, arrays[generation])
+
+
+class TestFrameHistory:
+    def _frames(self):
+        np.random.seed(7)
+        frames = [np.zeros((6, 5), dtype=np.uint32)]
+        for _ in range(10):
+            frame = frames[-1].copy()
+            frame.flat[np.random.randint(0, 30, 3)] = np.random.randint(1, 9, 3)
+            frames.append(frame)
+        return frames
+
+    def test_get_frame(self):
+        history = core.FrameHistory(keyframe_interval=4)
+        frames = self._frames()
+        for frame in frames:
+            history.record(frame)
+        assert len(history) == 11
+        assert sorted(history._keyframes) == [0, 4, 8]
+        for generation, frame in enumerate(frames):
+            assert np.array_equal(history.get_frame(generation), frame)
+        assert np.array_equal(history.get_frame(-1), frames[-1])
+
+    def test_record_changed(self):
+        history = core.FrameHistory(keyframe_interval=4)
+        frames = self._frames()
+        history.record(frames[0])
+        for previous, frame in zip(frames, frames[1:]):
+            history.record(frame, np.flatnonzero(frame != previous))
+        for generation, frame in enumerate(frames):
+            assert np.array_equal(history.get_frame(generation), frame)
+
+    def test_max_frames(self):
+        history = core.FrameHistory(keyframe_interval=2, max_frames=5)
+        frames = self._frames()
+        for frame in frames:
+            history.record(frame)
+            assert len(history) <= 5
+        assert sorted(history._keyframes) == [0, 2, 4]
+        for generation, frame in enumerate(frames[-len(history):]):
+            assert np.array_equal(history.get_frame(generation), frame)
+        with pytest.raises(ValueError):
+            core.FrameHistory(keyframe_interval=4, max_frames=2)
+
+    def test_truncate(self):
+        history = core.FrameHistory(keyframe_interval=4)
+        frames = self._frames()
+        for frame in frames[:9]:
+            history.record(frame)
+        history.truncate(6)
+        assert len(history) == 6
+        assert sorted(history._keyframes) == [0, 4]
+        for frame in frames[6:]:
+            history.record(frame)
+        for generation, frame in enumerate(frames):
+            assert np.array_equal(history.get_frame(generation), frame)
+
+    def test_save_load(self):
+        history = core.FrameHistory(keyframe_interval=3)
+        frames = self._frames()
+        for frame in frames:
+            history.record(frame)
+        filename = 'test.core.frame.history.npz'
+        history.save(filename)
+        loaded = core.FrameHistory()
+        loaded.load(filename)
+        os.remove(filename)
+        assert len(loaded) == len(frames)
+        for generation, frame in enumerate(frames):
+            assert np.array_equal(loaded.get_frame(generation), frame)
+
+    def test_save_load_empty(self):
+        filename = 'test.core.frame.history.empty.npz'
+        core.FrameHistory().save(filename)
+        loaded = core.FrameHistory()
+        loaded.load(filename)
+        os.remove(filename)
+        assert len(loaded) == 0
+
+
 class TestArrayBuilder:
     def test_get_array(self):
         builder = core.ArrayBuilder()
@@ -519,6 +1356,19 @@ class TestArrayBuilder:
                 [2181898220, 0, 0]
             ]))
 
+    def test_add_seed_without_replacement(self):
+        builder = core.ArrayBuilder()
+        builder.new_array(4, 5)
+        builder.get_array()[0, :] = 7
+        np.random.seed(7)
+        added_seeds = builder.add_seed(30)
+        array = builder.get_array()
+        assert len(added_seeds) == 15
+        assert 7 not in added_seeds
+        assert array.all()
+        assert len(np.unique(array[1:])) == 15
+        assert set(array[1:].ravel()) == added_seeds
+
     def test_add_inclusions(self):
         builder = core.ArrayBuilder()
         builder.new_array(3, 3)
@@ -534,6 +1384,26 @@ class TestArrayBuilder:
             ])
         )
 
+    def test_dilate(self):
+        builder = core.ArrayBuilder()
+        np.random.seed(7)
+        mask = np.random.random_sample((9, 12)) < 0.05
+        for radius in range(4):
+            good_mask = np.zeros_like(mask)
+            for x, y in zip(*np.nonzero(mask)):
+                for p, q in builder.filled_circle(x, y, radius):
+                    if 0 <= p < 9 and 0 <= q < 12:
+                        good_mask[p, q] = True
+            assert np.array_equal(builder._dilate(mask, radius), good_mask)
+
+    def test_add_inclusions_radius(self):
+        builder = core.ArrayBuilder()
+        builder.new_array(20, 20)
+        np.random.seed(7)
+        builder.add_inclusions(1, 3, 3)
+        inclusions = builder.get_array() == np.uint32(-1)
+        assert inclusions.sum() == builder._disk(3).sum()
+
     def test_horizontal_line(self):
         builder = core.ArrayBuilder()
         line = builder._horizontal_line(5, -3, 0)
@@ -595,6 +1465,24 @@ class TestArrayBuilder:
             array
         )
 
+    def test_remove_fields_boxes(self):
+        builder = core.ArrayBuilder()
+        builder.set_array(
+            np.array([
+                [5, 0, 1],
+                [1, 1, 1],
+                [3, 0, 0]
+            ], dtype=np.uint32)
+        )
+        builder.remove_fields({1, 3, 4}, {1: (0, 0, 1, 2), 3: (2, 0, 2, 0), 4: None})
+        assert np.array_equal(
+            builder.get_array(),
+            np.array([
+                [5, 0, 0],
+                [0, 0, 0],
+                [0, 0, 0]
+            ]))
+
     def test_get_seed_ids(self):
         builder = core.ArrayBuilder()
         builder.set_array(
@@ -658,6 +1546,14 @@ class TestGrainHistory:
         history.remove_grains([1, 4])
         assert history.get_log() == [(2, 3), {5, 6}]
 
+    def test_remove_grains_unaffected_phases(self):
+        history = core.GrainHistory()
+        history.set_log([(1, 2, 3), (4, 5, 6), (7, 8)])
+        phase = history._log[1]
+        history.remove_grains({7, 2})
+        assert history._log == [(1, 3), (4, 5, 6), (8,)]
+        assert history._log[1] is phase
+
     def test_set_log(self):
         history = core.GrainHistory()
         history_log = [(1,2,3), {4, 5}]
@@ -667,11 +1563,71 @@ class TestGrainHistory:
         history.set_log([(1, 2, 3), (4, 5)])
         assert history._log == [(1, 2, 3), (4, 5)]
 
+    def test_get_phase(self):
+        history = core.GrainHistory()
+        history.set_log([(1, 2), (3,), {4}])
+        assert history.get_phase(2) == 0
+        assert history.get_phase(3) == 1
+        assert history.get_phase(4) == 2
+        assert history.get_phase(5) is None
+        history.new_phase()
+        assert history.get_phase(4) == 2
+
     def test_get_flattened_closed_phases(self):
         history = core.GrainHistory()
         history.set_log([(1, 2, 3), (4, 5, 6), {7, 8}])
         assert tuple(history.get_flattened_closed_phases()) == (1, 2, 3, 4, 5 ,6)
 
+class TestGrainIndex:
+    def test_rebuild(self):
+        grain_index = core.GrainIndex()
+        grain_index.rebuild(np.array([
+            [0, 5, 5, 0],
+            [2, 5, 0, 0],
+            [2, 0, 0, np.uint32(-1)]
+        ], dtype=np.uint32))
+        assert grain_index.get_ids() == {2, 5}
+        assert grain_index.get_count(5) == 3
+        assert grain_index.get_count(7) == 0
+        assert grain_index.get_bounding_box(5) == (0, 1, 1, 2)
+        assert grain_index.get_bounding_box(2) == (1, 0, 2, 0)
+        assert grain_index.get_bounding_box(7) is None
+
+    def test_update(self):
+        solver = core.SolverCreator().create("Moore", "absorb", engine="vectorized")
+        np.random.seed(7)
+        builder = core.ArrayBuilder()
+        builder.new_array(20, 30)
+        builder.add_seed(5)
+        array = builder.get_array()
+        grain_index = core.GrainIndex()
+        grain_index.rebuild(array)
+        good_index = core.GrainIndex()
+        for _ in range(4):
+            array = solver.next_step(array)
+            grain_index.update(array, solver.get_changed_cells())
+            good_index.rebuild(array)
+            assert np.array_equal(grain_index._ids, good_index._ids)
+            assert np.array_equal(grain_index._counts, good_index._counts)
+            assert np.array_equal(grain_index._boxes, good_index._boxes)
+
+    def test_update_new_ids(self):
+        array = np.array([
+            [0, 5, 0],
+            [0, 0, 0]
+        ], dtype=np.uint32)
+        grain_index = core.GrainIndex()
+        grain_index.rebuild(array)
+        array[0, 0] = 9
+        array[1, 2] = 3
+        array[1, 1] = 5
+        grain_index.update(array, [0, 4, 5])
+        assert np.array_equal(grain_index._ids, [3, 5, 9])
+        assert np.array_equal(grain_index._counts, [1, 2, 1])
+        assert grain_index.get_bounding_box(5) == (0, 1, 1, 1)
+        assert grain_index.get_bounding_box(3) == (1, 2, 1, 2)
+
+
 class TestSeedSelector:
     def test_toggle_grain(self):
         selector = core.SeedSelector()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import cellular_automaton.labeling as labeling
+
+
+class TestGrainLabeling:
+    def test_relabel(self):
+        grain_labeling = labeling.GrainLabeling()
+        array = np.array([
+            [0, 3000000000, 3000000000],
+            [17, np.uint32(-1), 17]
+        ], dtype=np.uint32)
+        labels, table = grain_labeling.relabel(array)
+        assert labels.dtype == np.uint16
+        assert np.array_equal(labels, [[0, 2, 2], [1, 3, 1]])
+        assert np.array_equal(table, [0, 17, 3000000000, np.uint32(-1)])
+        assert np.array_equal(grain_labeling.restore(labels, table), array)
+        assert np.array_equal(grain_labeling.get_grain_labels(labels, table), [1, 2])
+
+    def test_relabel_large(self):
+        grain_labeling = labeling.GrainLabeling()
+        array = np.arange(70000, dtype=np.uint32).reshape(350, 200)
+        labels, table = grain_labeling.relabel(array)
+        assert labels.dtype == np.uint32
+        assert np.array_equal(grain_labeling.restore(labels, table), array)
+
+    def test_label_components(self):
+        grain_labeling = labeling.GrainLabeling()
+        array = np.array([
+            [1, 1, 0, 2],
+            [0, 0, 1, 0],
+            [2, 0, 0, 1]
+        ], dtype=np.uint32)
+        components, count = grain_labeling.label_components(array, connectivity=4)
+        assert count == 5
+        components, count = grain_labeling.label_components(array, connectivity=8)
+        assert count == 3
+        assert components[0, 0] == components[1, 2] == components[2, 3]
+        assert components[1, 0] == -1
+        components, count = grain_labeling.label_components(array, connectivity=8, wrap=True)
+        assert count == 2
+
+    def test_get_fragments(self):
+        grain_labeling = labeling.GrainLabeling()
+        array = np.array([
+            [1, 1, 0, 2],
+            [0, 0, 0, 0],
+            [3, 0, 1, 1]
+        ], dtype=np.uint32)
+        assert grain_labeling.get_fragments(array) == {1: 2}
+        assert grain_labeling.get_fragments(array, wrap=True) == {}
+
+
+class TestGrainPalette:
+    def test_encode_decode(self):
+        palette = labeling.GrainPalette()
+        array = np.array([
+            [0, 3000000000, 3000000000],
+            [17, np.uint32(-1), 17]
+        ], dtype=np.uint32)
+        labels = palette.encode(array)
+        assert labels.dtype == np.uint16
+        assert np.array_equal(labels, [[0, 2, 2], [1, 65535, 1]])
+        assert np.array_equal(palette.decode(labels), array)
+        assert palette.get_labels([17, 5, 3000000000]) == [1, 2]
+        assert np.array_equal(palette.get_ids(), [0, 17, 3000000000])
+        assert np.array_equal(palette.encode(np.array([[5, 17]])), [[3, 1]])
+
+    def test_set_ids(self):
+        palette = labeling.GrainPalette()
+        palette.set_ids([0, 40, 30])
+        assert np.array_equal(palette.encode(np.array([[30, 40, 0]])), [[2, 1, 0]])
+        palette.clear()
+        assert np.array_equal(palette.get_ids(), [0])
+
+    def test_too_many_grains(self):
+        palette = labeling.GrainPalette()
+        with pytest.raises(ValueError):
+            palette.encode(np.arange(1, 70000, dtype=np.uint32))
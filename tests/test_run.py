@@ -0,0 +1,59 @@
+import numpy as np
+import os
+import cellular_automaton.core as core
+import cellular_automaton.run as run
+
+
+class TestRun:
+    def test_parse_args(self):
+        args = run.parse_args(['--height', '10', '--output', 'a.csv', '--output', 'a.png'])
+        assert args.height == 10
+        assert args.width == 100
+        assert args.output == ['a.csv', 'a.png']
+
+    def test_main(self):
+        filename = 'test.run.main.csv'
+        result = run.main([
+            '--height', '8',
+            '--width', '6',
+            '--seeds', '2',
+            '--random-seed', '7',
+            '--output', filename])
+        lines = [line.strip().split(',') for line in open(filename) if not line.startswith('#')]
+        os.remove(filename)
+        assert result == 0
+        array = np.array(lines, dtype=np.uint32)
+        assert array.shape == (8, 6)
+        assert array.all()
+
+    def test_main_frames(self):
+        filename = 'test.run.main.frames.npz'
+        run.main([
+            '--height', '8',
+            '--width', '6',
+            '--seeds', '2',
+            '--random-seed', '7',
+            '--frames', filename])
+        frames = list(core.FrameExporter.read_frames(filename))
+        os.remove(filename)
+        assert [generation for generation, _ in frames] == list(range(len(frames)))
+        assert not frames[0][1].all()
+        assert frames[-1][1].all()
+
+    def test_main_resume(self):
+        checkpoint = 'test.run.main.checkpoint.npz'
+        filename = 'test.run.main.resume.csv'
+        arguments = [
+            '--height', '20',
+            '--width', '20',
+            '--seeds', '3',
+            '--state', 'grain-curvature-probability:0.5',
+            '--random-seed', '7']
+        run.main(arguments + ['--output', filename])
+        expected = [line for line in open(filename)]
+        run.main(arguments + ['--checkpoint', checkpoint, '--checkpoint-every', '2', '--max-steps', '3'])
+        run.main(arguments + ['--checkpoint', checkpoint, '--resume', '--output', filename])
+        result = [line for line in open(filename)]
+        os.remove(filename)
+        os.remove(checkpoint)
+        assert result == expected
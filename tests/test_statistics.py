@@ -0,0 +1,54 @@
+import numpy as np
+import cellular_automaton.core as core
+import cellular_automaton.statistics as statistics
+
+
+class TestGrainStatistics:
+    def test_get_areas(self):
+        grain_statistics = statistics.GrainStatistics()
+        ids, areas = grain_statistics.get_areas(np.array([
+            [0, 5, 5],
+            [2, 5, np.uint32(-1)]
+        ], dtype=np.uint32))
+        assert np.array_equal(ids, [2, 5])
+        assert np.array_equal(areas, [1, 3])
+
+    def test_compute(self):
+        grain_statistics = statistics.GrainStatistics()
+        array = np.array([
+            [2, 2, 3, 3, 3],
+            [2, 2, 3, 3, 3],
+            [2, 2, 3, 3, 3],
+            [2, 2, 3, 3, 3]
+        ], dtype=np.uint32)
+        result = grain_statistics.compute(array, core.AbsorbBoundary(), [(2,), {3}], bins=2)
+        assert result["grain_number"] == 2
+        assert np.array_equal(result["areas"], [8, 12])
+        assert result["average_size"] == 10
+        assert np.allclose(result["equivalent_diameters"], 2 * np.sqrt(np.array([8, 12]) / np.pi))
+        assert np.array_equal(result["size_histogram"][0], [1, 1])
+        assert np.array_equal(result["perimeters"], [12, 14])
+        assert np.array_equal(result["neighbor_counts"], [1, 1])
+        assert result["phase_fractions"] == {0: 0.4, 1: 0.6}
+        assert result["empty_fraction"] == 0
+
+    def test_compute_boundary(self):
+        grain_statistics = statistics.GrainStatistics()
+        array = np.array([
+            [1, 0, 2],
+            [0, 3, 0],
+            [4, 0, np.uint32(-1)]
+        ], dtype=np.uint32)
+        periodic = grain_statistics.compute(array, core.PeriodicBoundary())
+        absorb = grain_statistics.compute(array, core.AbsorbBoundary())
+        assert np.array_equal(periodic["perimeters"], [4, 4, 4, 4])
+        assert np.array_equal(absorb["neighbor_counts"], [1, 1, 3, 1])
+        assert np.array_equal(periodic["neighbor_counts"], [3, 3, 3, 3])
+        assert periodic["phase_fractions"] == {-1: 4 / 9}
+        assert absorb["inclusion_fraction"] == 1 / 9
+
+    def test_compute_empty(self):
+        result = statistics.GrainStatistics().compute(np.zeros((2, 2), dtype=np.uint32))
+        assert result["grain_number"] == 0
+        assert result["average_size"] == 0
+        assert result["empty_fraction"] == 1